@@ -0,0 +1,81 @@
+"""Compare pydantic SearchResult models with the compact offer representation.
+
+Decodes the bundled provider fixtures (repeated ``--scale`` times) both ways
+and reports construction time and retained memory per offer.
+
+Usage::
+
+    python -m bench.compact_results [--scale 50] [--repeat 5]
+"""
+import argparse
+import gc
+import json
+import pathlib
+import time
+import tracemalloc
+from typing import Callable
+
+from src.reqresp import compact
+from src.reqresp import search
+
+
+RESOURCES = pathlib.Path(__file__).resolve().parent.parent / "resources"
+FIXTURES = ("provider-a.json", "provider-b.json")
+
+
+def load_offers(scale: int) -> list[dict]:
+    offers = []
+    for name in FIXTURES:
+        offers.extend(json.loads((RESOURCES / name).read_text()))
+    return offers * scale
+
+
+def build_models(raw: list[dict]) -> list:
+    return [search.SearchResult.model_validate(offer) for offer in raw]
+
+
+def build_compact(raw: list[dict]) -> list:
+    decoder = compact.OfferDecoder()
+    return [decoder.offer(offer) for offer in raw]
+
+
+def measure(build: Callable[[list[dict]], list], raw: list[dict], repeat: int) -> tuple[float, float]:
+    """Best construction time in microseconds per offer, and retained bytes per offer."""
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        build(raw)
+        best = min(best, time.perf_counter() - started)
+
+    gc.collect()
+    tracemalloc.start()
+    built = build(raw)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del built
+    return best * 1e6 / len(raw), retained / len(raw)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=int, default=50, help="Times the fixtures are repeated")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing runs; the best one is reported")
+    args = parser.parse_args()
+
+    raw = load_offers(args.scale)
+    print(f"{len(raw)} offers from {', '.join(FIXTURES)} x{args.scale}")
+    print(f"{'representation':<16}{'us/offer':>12}{'bytes/offer':>14}")
+
+    results = {}
+    for name, build in (("pydantic", build_models), ("compact", build_compact)):
+        results[name] = measure(build, raw, args.repeat)
+        per_offer_us, per_offer_bytes = results[name]
+        print(f"{name:<16}{per_offer_us:>12.1f}{per_offer_bytes:>14.0f}")
+
+    (model_us, model_bytes), (compact_us, compact_bytes) = results["pydantic"], results["compact"]
+    print(f"compact is {model_us / compact_us:.1f}x faster and {model_bytes / compact_bytes:.1f}x smaller")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+"""End-to-end load test of the search pipeline against local provider stand-ins.
+
+Starts one HTTP stand-in per provider serving the bundled fixtures with a
+configurable latency distribution and error rate, launches the API (and
+optionally standalone workers) pointed at them, then sends searches to
+``POST /api/v1/search`` and follows each one until it finishes. Reports
+throughput and p50/p95/p99 time to first result, time to complete and the
+latency of fetching the finished result from ``/results``.
+
+Needs a Redis server; use a database you can spare, since searches, results
+and caches are written to it.
+
+Usage::
+
+    python -m bench.load_test --redis-url redis://localhost:6379/15 \\
+        --searches 500 --rate 20 --alpha-latency lognormal:1.5:0.5 --betta-latency uniform:2:6 \\
+        [--workers 4] [--replay searches.jsonl] [--json report.json]
+
+Latencies are ``fixed:S``, ``uniform:LOW:HIGH`` or ``lognormal:MEDIAN:SIGMA``
+in seconds, applied before the first byte of each provider response. Replay
+files hold one JSON object per line: search criteria, optionally wrapped as
+``{"at": seconds_from_start, "criteria": {...}}``.
+"""
+import argparse
+import asyncio
+import dataclasses
+import datetime
+import json
+import math
+import os
+import pathlib
+import random
+import subprocess
+import sys
+import time
+from typing import Callable, Optional
+
+import aiohttp
+from aiohttp import web
+
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+RESOURCES = ROOT / "resources"
+PROVIDER_FIXTURES = {"alpha": "provider-a.json", "betta": "provider-b.json"}
+PROVIDER_URL_KEYS = {"alpha": "PROVIDER_A_API_BASE_URL", "betta": "PROVIDER_B_API_BASE_URL"}
+AIRPORTS = ("ALA", "NQZ", "CIT", "AKX", "GUW", "DXB", "IST", "FRA", "BKK", "TAS")
+FINISHED = ("completed", "error")
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    kind, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(":") if value]
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal" and len(values) == 2:
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    raise argparse.ArgumentTypeError(f"Invalid latency {spec!r}; use fixed:S, uniform:LOW:HIGH or lognormal:MEDIAN:SIGMA")
+
+
+class ProviderStandIn:
+    """Serves a provider fixture on ``POST /search`` after a sampled delay, failing a share of requests."""
+
+    def __init__(self, name: str, latency: Callable[[], float], error_rate: float, transfer: float, chunks: int = 8):
+        self.name = name
+        self.body = (RESOURCES / PROVIDER_FIXTURES[name]).read_bytes()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.transfer = transfer
+        self.chunks = max(1, chunks)
+        self.requests = 0
+        self.errors = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _search(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        await request.read()
+        await asyncio.sleep(self.latency())
+        if random.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response({"error": "stand-in failure"}, status=500)
+
+        response = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await response.prepare(request)
+        size = math.ceil(len(self.body) / self.chunks)
+        for start in range(0, len(self.body), size):
+            await response.write(self.body[start:start + size])
+            if self.transfer:
+                await asyncio.sleep(self.transfer / self.chunks)
+        await response.write_eof()
+        return response
+
+    async def _head(self, request: web.Request) -> web.Response:
+        return web.Response()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_post("/search", self._search)
+        app.router.add_route("HEAD", "/", self._head)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        return f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+@dataclasses.dataclass
+class SearchSample:
+    started: float
+    status: str = "lost"
+    ttfr: Optional[float] = None
+    ttc: Optional[float] = None
+    fetch: Optional[float] = None
+    items: int = 0
+
+
+def synthesize(searches: int, rate: float, distinct: int, seed: int) -> list[tuple[float, dict]]:
+    """Poisson arrivals at ``rate`` per second over ``distinct`` different itineraries."""
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    pool = []
+    for _ in range(max(1, distinct)):
+        origin, destination = rng.sample(AIRPORTS, 2)
+        departure = today + datetime.timedelta(days=rng.randint(1, 180))
+        criteria = {"origin": origin, "destination": destination, "departure_date": departure.isoformat()}
+        if rng.random() < 0.5:
+            criteria["return_date"] = (departure + datetime.timedelta(days=rng.randint(1, 21))).isoformat()
+        pool.append(criteria)
+
+    schedule, at = [], 0.0
+    for index in range(searches):
+        schedule.append((at, pool[index % len(pool)]))
+        at += rng.expovariate(rate) if rate > 0 else 0.0
+    return schedule
+
+
+def replay(path: pathlib.Path) -> list[tuple[float, dict]]:
+    schedule = []
+    for line in path.read_text().splitlines():
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        if "criteria" in entry:
+            schedule.append((float(entry.get("at", 0.0)), entry["criteria"]))
+        else:
+            schedule.append((0.0, entry))
+    return sorted(schedule, key=lambda item: item[0])
+
+
+async def follow_search(
+    session: aiohttp.ClientSession, api_url: str, criteria: dict, currency: str, timeout: float
+) -> SearchSample:
+    sample = SearchSample(started=time.perf_counter())
+    async with session.post(f"{api_url}/api/v1/search", json=criteria) as response:
+        if response.status == 429:
+            sample.status = "rejected"
+            return sample
+        response.raise_for_status()
+        search_id = (await response.json())["search_id"]
+
+    events_url = f"{api_url}/api/v1/results/{search_id}/{currency}/events"
+    try:
+        async with asyncio.timeout(timeout):
+            async with session.get(events_url) as response:
+                response.raise_for_status()
+                event = None
+                async for raw in response.content:
+                    line = raw.decode().rstrip("\n")
+                    if line.startswith("event:"):
+                        event = line.partition(":")[2].strip()
+                    elif line.startswith("data:") and event == "items" and sample.ttfr is None:
+                        sample.ttfr = time.perf_counter() - sample.started
+                    elif line.startswith("data:") and event == "status":
+                        status = json.loads(line.partition(":")[2])
+                        if status["status"] in FINISHED:
+                            sample.ttc = time.perf_counter() - sample.started
+                            sample.status = status["status"]
+                            break
+    except TimeoutError:
+        sample.status = "timeout"
+        return sample
+
+    fetched = time.perf_counter()
+    async with session.get(f"{api_url}/api/v1/results/{search_id}/{currency}") as response:
+        if response.status == 200:
+            sample.items = len((await response.json()).get("items") or [])
+            sample.fetch = time.perf_counter() - fetched
+    return sample
+
+
+async def drive(
+    api_url: str,
+    schedule: list[tuple[float, dict]],
+    currency: str,
+    timeout: float,
+    max_in_flight: int,
+) -> tuple[list[SearchSample], float]:
+    """Send the searches at their scheduled times (open loop) and follow each to completion."""
+    limit = asyncio.Semaphore(max_in_flight)
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=None)) as session:
+        started = time.perf_counter()
+
+        async def _one(at: float, criteria: dict) -> SearchSample:
+            await asyncio.sleep(max(0.0, started + at - time.perf_counter()))
+            async with limit:
+                try:
+                    return await follow_search(session, api_url, criteria, currency, timeout)
+                except aiohttp.ClientError as exc:
+                    print(f"search failed: {exc}", file=sys.stderr)
+                    return SearchSample(started=time.perf_counter(), status="failed")
+
+        samples = await asyncio.gather(*(_one(at, criteria) for at, criteria in schedule))
+        return samples, time.perf_counter() - started
+
+
+def percentile(values: list[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+
+def summarize(samples: list[SearchSample], elapsed: float, stand_ins: list[ProviderStandIn]) -> dict:
+    statuses: dict[str, int] = {}
+    for sample in samples:
+        statuses[sample.status] = statuses.get(sample.status, 0) + 1
+    finished = [sample for sample in samples if sample.ttc is not None]
+    report = {
+        "searches": len(samples),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(len(finished) / elapsed, 3) if elapsed else None,
+        "statuses": statuses,
+        "providers": {stand_in.name: {"requests": stand_in.requests, "errors": stand_in.errors} for stand_in in stand_ins},
+    }
+    for metric in ("ttfr", "ttc", "fetch"):
+        values = [getattr(sample, metric) for sample in samples if getattr(sample, metric) is not None]
+        report[metric] = {
+            f"p{round(fraction * 100)}_s": None if (value := percentile(values, fraction)) is None else round(value, 4)
+            for fraction in (0.5, 0.95, 0.99)
+        } | {"count": len(values)}
+    return report
+
+
+def print_report(report: dict) -> None:
+    print(f"{report['searches']} searches in {report['elapsed_s']}s, "
+          f"{report['throughput_per_s']} completed/s, statuses {report['statuses']}")
+    print(f"provider requests {report['providers']}")
+    print(f"{'':<8}{'p50 s':>10}{'p95 s':>10}{'p99 s':>10}{'count':>8}")
+    for metric, label in (("ttfr", "TTFR"), ("ttc", "TTC"), ("fetch", "fetch")):
+        row = report[metric]
+        cells = "".join(f"{'-' if row[key] is None else format(row[key], '.3f'):>10}" for key in ("p50_s", "p95_s", "p99_s"))
+        print(f"{label:<8}{cells}{row['count']:>8}")
+
+
+def start_service(args, provider_urls: dict[str, str]) -> list[subprocess.Popen]:
+    env = {
+        **os.environ,
+        "REDIS_URL": args.redis_url,
+        "SEARCH_PROVIDERS": ",".join(provider_urls),
+        **{PROVIDER_URL_KEYS[name]: url for name, url in provider_urls.items()},
+        "SEARCH_CONSUMER_ENABLED": "false" if args.workers else "true",
+    }
+    for entry in args.env:
+        key, _, value = entry.partition("=")
+        env[key] = value
+
+    processes = [subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.api.app:app", "--port", str(args.api_port),
+         "--workers", str(args.api_workers), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )]
+    if args.workers:
+        processes.append(subprocess.Popen(
+            [sys.executable, "worker.py", "--processes", str(args.workers)],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ))
+    return processes
+
+
+async def wait_until_ready(api_url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f"{api_url}/health") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+    raise RuntimeError(f"API at {api_url} did not become ready in {timeout}s")
+
+
+async def run(args) -> dict:
+    stand_ins = [
+        ProviderStandIn("alpha", args.alpha_latency, args.alpha_errors, args.transfer),
+        ProviderStandIn("betta", args.betta_latency, args.betta_errors, args.transfer),
+    ]
+    provider_urls = {
+        stand_in.name: await stand_in.start(port=args.stand_in_port + index if args.stand_in_port else 0)
+        for index, stand_in in enumerate(stand_ins)
+    }
+    processes = [] if args.api_url else start_service(args, provider_urls)
+    api_url = args.api_url or f"http://127.0.0.1:{args.api_port}"
+    try:
+        if args.api_url:
+            print(f"Point the service at the stand-ins: {provider_urls}")
+        await wait_until_ready(api_url)
+        schedule = replay(args.replay) if args.replay else synthesize(args.searches, args.rate, args.distinct or args.searches, args.seed)
+        samples, elapsed = await drive(api_url, schedule, args.currency, args.timeout, args.max_in_flight)
+        return summarize(samples, elapsed, stand_ins)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        for stand_in in stand_ins:
+            await stand_in.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15", help="Redis used by the launched service")
+    parser.add_argument("--api-url", help="Test an already running API instead of launching one")
+    parser.add_argument("--api-port", type=int, default=8900)
+    parser.add_argument("--api-workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--workers", type=int, default=0, help="Standalone search workers (0: consume in the API)")
+    parser.add_argument("--stand-in-port", type=int, default=0, help="Port of the alpha stand-in, betta uses the next one")
+    parser.add_argument("--env", action="append", default=[], help="Extra KEY=VALUE setting for the service")
+    parser.add_argument("--searches", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=10.0, help="Searches started per second (0: all at once)")
+    parser.add_argument("--distinct", type=int, default=0, help="Distinct itineraries searched (default: all different)")
+    parser.add_argument("--replay", type=pathlib.Path, help="JSONL file of searches to send instead of synthesized ones")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--currency", default="KZT")
+    parser.add_argument("--timeout", type=float, default=180.0, help="Seconds to follow one search")
+    parser.add_argument("--max-in-flight", type=int, default=1000)
+    parser.add_argument("--alpha-latency", type=parse_latency, default=parse_latency("lognormal:1:0.5"))
+    parser.add_argument("--betta-latency", type=parse_latency, default=parse_latency("lognormal:2:0.5"))
+    parser.add_argument("--alpha-errors", type=float, default=0.0, help="Share of alpha requests answered with 500")
+    parser.add_argument("--betta-errors", type=float, default=0.0, help="Share of betta requests answered with 500")
+    parser.add_argument("--transfer", type=float, default=0.0, help="Seconds each provider body takes to send")
+    parser.add_argument("--json", type=pathlib.Path, help="Also write the report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""Time and peak allocations of the CPU-bound stages of a search.
+
+Scales the bundled provider fixtures up to thousands of offers (every copy
+gets its own flight numbers and slightly different prices), lets betta resell
+an ``--overlap`` share of alpha's itineraries in KZT so the merge compares
+prices across currencies, and runs each stage on them in isolation:
+
+* ``validate.alpha`` / ``validate.betta``: ``AlphaSearchResponse`` /
+  ``BettaSearchResponse`` validation of the raw provider body
+* ``decode.stream``: the worker's streaming decode into compact offers
+* ``rates.parse``: ``parse_national_bank_rate`` on a sample bank XML
+* ``merge``: ``OfferMerger`` over both providers' offers
+* ``convert``: ``PriceColumn.from_offers`` and the conversion ``GET /results``
+  does on the stored offers
+* ``serialize.view``: the encoding of the converted ``GET /results`` body
+* ``read.validate`` and ``serialize.model_dump``: ``SearchResponse``
+  validation and ``model_dump`` + ``json.dumps``, the model path paged reads
+  still take; ``serialize.model_dump_json`` and ``serialize.store`` (the
+  worker's stored encoding) for comparison
+
+Usage::
+
+    python -m bench.stages [--scale 50] [--overlap 0.2] [--repeat 7] [--json stages.json] [--compare baseline.json]
+
+Save a run with ``--json`` on one commit and pass it to ``--compare`` on
+another to see the change per stage.
+"""
+import argparse
+import dataclasses
+import gc
+import json
+import pathlib
+import platform
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+from typing import Any, Callable, Optional
+
+from src.api import rates
+from src.api.routes import search as search_routes
+from src.client import streaming
+from src.client.nationalbank.client import parse_national_bank_rate
+from src.reqresp import compact
+from src.reqresp import search
+from src.reqresp.price_column import PriceColumn
+from src.worker.merge import OfferMerger
+
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+RESOURCES = ROOT / "resources"
+TARGET_CURRENCY = "USD"
+
+# KZT per unit, roughly as published by the National Bank.
+BANK_RATES = {
+    "AUD": 330.5, "AZN": 296.8, "AMD": 1.31, "BYN": 154.2, "BRL": 92.4, "HUF": 1.41, "HKD": 64.8,
+    "GEL": 185.6, "DKK": 78.9, "AED": 137.4, "USD": 505.5, "EUR": 545.1, "INR": 5.96, "IRR": 0.012,
+    "CAD": 362.3, "CNY": 70.2, "KWD": 1650.7, "KGS": 5.78, "MYR": 115.3, "MXN": 27.1, "MDL": 28.9,
+    "NOK": 48.2, "PLN": 126.4, "SAR": 134.6, "RUB": 6.12, "XDR": 686.3, "SGD": 390.8, "TJS": 47.3,
+    "THB": 15.4, "TRY": 12.1, "UZS": 0.04, "UAH": 12.2, "GBP": 640.9, "CZK": 21.7, "SEK": 47.9,
+    "CHF": 583.2, "ZAR": 28.4, "KRW": 0.37, "JPY": 3.35,
+}
+
+
+def bank_xml() -> str:
+    """Sample response of the bank's rates feed with every currency above."""
+    items = "".join(
+        f"<item><fullname>{code}</fullname><title>{code}</title><description>{rate}</description>"
+        f"<quant>1</quant><index>UP</index><change>0.5</change></item>"
+        for code, rate in BANK_RATES.items()
+    )
+    return (
+        '<?xml version="1.0" encoding="utf-8"?><rates><generator>ZEUS</generator>'
+        "<title>Official exchange rates</title><link>https://nationalbank.kz</link>"
+        "<description>Official exchange rates</description><copyright>NBRK</copyright>"
+        f"<date>17.10.2026</date>{items}</rates>"
+    )
+
+
+def scale_offers(raw: list[dict], scale: int, seed: int) -> list[dict]:
+    """``scale`` copies of the offers, each copy selling different flights at jittered prices."""
+    rng = random.Random(seed)
+    offers = []
+    for copy in range(scale):
+        for offer in raw:
+            offer = json.loads(json.dumps(offer))
+            for flight in offer["flights"]:
+                for segment in flight["segments"]:
+                    if copy:
+                        segment["flight_number"] = f"{segment['flight_number']}{copy:03d}"
+            factor = rng.uniform(0.95, 1.05)
+            for key in ("total", "base", "taxes"):
+                offer["pricing"][key] = f"{float(offer['pricing'][key]) * factor:.2f}"
+            offers.append(offer)
+    return offers
+
+
+def resell(offers: list[dict], share: float, currency: str, seed: int) -> list[dict]:
+    """A ``share`` of the offers, priced in ``currency`` by another provider at up to 5% either way."""
+    rng = random.Random(seed)
+    resold = []
+    for offer in rng.sample(offers, round(len(offers) * share)):
+        offer = json.loads(json.dumps(offer))
+        pricing = offer["pricing"]
+        factor = BANK_RATES.get(pricing["currency"].upper(), 1.0) / BANK_RATES.get(currency, 1.0) * rng.uniform(0.95, 1.05)
+        for key in ("total", "base", "taxes"):
+            pricing[key] = f"{float(pricing[key]) * factor:.2f}"
+        pricing["currency"] = currency
+        resold.append(offer)
+    return resold
+
+
+def decode_stream(body: bytes) -> list[compact.CompactOffer]:
+    stream = streaming.JsonArrayStream()
+    decoder = compact.OfferDecoder()
+    offers = []
+    for start in range(0, len(body), streaming.STREAM_CHUNK_SIZE):
+        offers.extend(decoder.offer(raw) for raw in stream.feed(body[start:start + streaming.STREAM_CHUNK_SIZE]))
+    stream.close()
+    return offers
+
+
+@dataclasses.dataclass
+class Stage:
+    name: str
+    run: Callable[[], Any]
+    items: int
+
+
+def build_stages(scale: int, overlap: float, seed: int) -> tuple[list[Stage], dict]:
+    alpha_raw = scale_offers(json.loads((RESOURCES / "provider-a.json").read_text()), scale, seed)
+    betta_raw = scale_offers(json.loads((RESOURCES / "provider-b.json").read_text()), scale, seed + 1)
+    betta_raw += resell(alpha_raw, overlap, "KZT", seed + 2)
+    alpha_body = json.dumps(alpha_raw).encode()
+    betta_body = json.dumps(betta_raw).encode()
+    xml = bank_xml()
+
+    table = rates.RateTable.from_response(parse_national_bank_rate(xml), version=1)
+    alpha_offers = decode_stream(alpha_body)
+    betta_offers = decode_stream(betta_body)
+
+    def merge() -> compact.CompactSearch:
+        merger = OfferMerger(compact.CompactSearch(search_id="00000000-0000-0000-0000-000000000000"), rates=lambda: table)
+        for offer in alpha_offers:
+            merger.add(offer, "alpha")
+        for offer in betta_offers:
+            merger.add(offer, "betta")
+        return merger.result
+
+    merged = merge()
+    merged.status = search.SearchStatus.COMPLETED
+    document = merged.to_document()
+    response = search.SearchResponse.model_validate(document)
+
+    def convert() -> tuple[float, ...]:
+        return PriceColumn.from_offers(merged.items).convert(table, TARGET_CURRENCY)
+
+    amounts = convert()
+    for item, amount in zip(response.items or [], amounts):
+        item.price = search.Price(amount=amount, currency=TARGET_CURRENCY)
+
+    def serialize_dump() -> bytes:
+        # What FastAPI's response_model and JSONResponse do with the returned model.
+        return json.dumps(
+            response.model_dump(mode="json"), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode()
+
+    offers = len(alpha_offers) + len(betta_offers)
+    stages = [
+        Stage("validate.alpha", lambda: search.AlphaSearchResponse.model_validate_json(alpha_body), len(alpha_raw)),
+        Stage("validate.betta", lambda: search.BettaSearchResponse.model_validate_json(betta_body), len(betta_raw)),
+        Stage("decode.stream", lambda: (decode_stream(alpha_body), decode_stream(betta_body)), offers),
+        Stage("rates.parse", lambda: parse_national_bank_rate(xml), len(BANK_RATES)),
+        Stage("merge", merge, offers),
+        Stage("convert", convert, len(merged.items)),
+        Stage("serialize.view", lambda: search_routes._encode_view(merged, amounts, TARGET_CURRENCY), len(merged.items)),
+        Stage("read.validate", lambda: search.SearchResponse.model_validate(document), len(merged.items)),
+        Stage("serialize.model_dump", serialize_dump, len(merged.items)),
+        Stage("serialize.model_dump_json", response.model_dump_json, len(merged.items)),
+        Stage("serialize.store", lambda: compact.encode_offers(merged.items), len(merged.items)),
+    ]
+    workload = {
+        "alpha_offers": len(alpha_raw),
+        "betta_offers": len(betta_raw),
+        "merged_offers": len(merged.items),
+        "body_bytes": len(alpha_body) + len(betta_body),
+        "response_bytes": len(serialize_dump()),
+    }
+    return stages, workload
+
+
+def measure(stage: Stage, repeat: int) -> dict:
+    """Best and median wall time over ``repeat`` runs, and the peak memory allocated during one run."""
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        stage.run()
+        timings.append(time.perf_counter() - started)
+
+    gc.collect()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    stage.run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(timings)
+    return {
+        "items": stage.items,
+        "best_ms": round(best * 1e3, 3),
+        "median_ms": round(statistics.median(timings) * 1e3, 3),
+        "us_per_item": round(best * 1e6 / stage.items, 3) if stage.items else None,
+        "peak_kib": round((peak - baseline) / 1024, 1),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report: dict, baseline: Optional[dict] = None) -> None:
+    workload = report["workload"]
+    print(f"commit {report['commit']}, python {report['python']}, scale {report['scale']}: "
+          f"{workload['alpha_offers']} alpha + {workload['betta_offers']} betta offers, "
+          f"{workload['merged_offers']} merged")
+    if baseline and baseline.get("workload") != workload:
+        print(f"note: baseline {baseline.get('commit')} ran a different workload, compare us/item rather than ms")
+    header = f"{'stage':<28}{'best ms':>10}{'median ms':>11}{'us/item':>10}{'peak KiB':>11}"
+    print(header + (f"{'vs base':>9}" if baseline else ""))
+    for name, stage in report["stages"].items():
+        row = (f"{name:<28}{stage['best_ms']:>10.2f}{stage['median_ms']:>11.2f}"
+               f"{stage['us_per_item'] or 0:>10.2f}{stage['peak_kib']:>11.1f}")
+        base = (baseline or {}).get("stages", {}).get(name)
+        if base:
+            row += f"{stage['best_ms'] / base['best_ms']:>8.2f}x"
+        print(row)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=int, default=50, help="Times the fixtures are repeated")
+    parser.add_argument("--overlap", type=float, default=0.2, help="Share of alpha offers betta also sells, in KZT")
+    parser.add_argument("--repeat", type=int, default=7, help="Timing runs per stage; best and median are reported")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--stage", action="append", help="Only run stages starting with this name (repeatable)")
+    parser.add_argument("--json", type=pathlib.Path, help="Write the results to this file")
+    parser.add_argument("--compare", type=pathlib.Path, help="Results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    stages, workload = build_stages(max(1, args.scale), min(1.0, max(0.0, args.overlap)), args.seed)
+    if args.stage:
+        stages = [stage for stage in stages if stage.name.startswith(tuple(args.stage))]
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "scale": args.scale,
+        "overlap": args.overlap,
+        "repeat": args.repeat,
+        "workload": workload,
+        "stages": {stage.name: measure(stage, max(1, args.repeat)) for stage in stages},
+    }
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    print_report(report, baseline)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
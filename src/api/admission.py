@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import math
+import time
+from typing import NamedTuple, Optional
+
+import redis.asyncio as redis
+
+
+log = logging.getLogger("uvicorn.error")
+
+
+RATE_LIMIT_PREFIX = "rate_limit:search"
+
+# Refills the bucket for the time elapsed since the last call, then takes ``cost`` tokens if
+# there are enough. Returns {allowed, milliseconds until enough tokens are available}.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1]) or burst
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate / 1000)
+
+local allowed = 0
+local wait_ms = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    wait_ms = math.ceil((cost - tokens) * 1000 / rate)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+return {allowed, wait_ms}
+"""
+
+
+class Rejection(NamedTuple):
+    reason: str
+    retry_after: int
+
+
+class QueueStats(NamedTuple):
+    length: int
+    lag: int
+    pending: int
+
+
+class TokenBucket:
+    """Per-client request rate limit shared by all API processes through Redis."""
+
+    def __init__(self, redis_client: redis.Redis, *, rate: float, burst: int) -> None:
+        self.redis_client = redis_client
+        self.rate = rate
+        self.burst = burst
+        self._script = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def acquire(self, client_id: str) -> Optional[float]:
+        """Take a token for ``client_id``; None if allowed, else seconds until one is available."""
+        allowed, wait_ms = await self._script(
+            keys=[f"{RATE_LIMIT_PREFIX}:{client_id}"],
+            args=[self.rate, self.burst, 1],
+        )
+        return None if int(allowed) else int(wait_ms) / 1000
+
+
+class AdmissionController:
+    """Rejects new searches while the search stream is backed up or a client exceeds its rate.
+
+    The queue is inspected at most once per ``check_interval`` seconds, so the
+    check costs nothing on most requests. A limit of 0 disables it.
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        *,
+        stream: str,
+        group: str,
+        max_length: int = 0,
+        max_lag: int = 0,
+        max_pending: int = 0,
+        retry_after: int = 5,
+        check_interval: float = 1.0,
+        rate_limit: Optional[TokenBucket] = None,
+    ) -> None:
+        self.redis_client = redis_client
+        self.stream = stream
+        self.group = group
+        self.max_length = max_length
+        self.max_lag = max_lag
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self.check_interval = check_interval
+        self.rate_limit = rate_limit
+        self._stats = QueueStats(0, 0, 0)
+        self._checked_at = -math.inf
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def from_config(cls, redis_client: redis.Redis, config, *, stream: str, group: str) -> "AdmissionController":
+        rate = float(config.get("SEARCH_RATE_LIMIT", 0))
+        return cls(
+            redis_client,
+            stream=stream,
+            group=group,
+            max_length=int(config.get("SEARCH_ADMISSION_MAX_LENGTH", 0)),
+            max_lag=int(config.get("SEARCH_ADMISSION_MAX_LAG", 1_000)),
+            max_pending=int(config.get("SEARCH_ADMISSION_MAX_PENDING", 1_000)),
+            retry_after=int(config.get("SEARCH_ADMISSION_RETRY_AFTER", 5)),
+            check_interval=float(config.get("SEARCH_ADMISSION_CHECK_INTERVAL", 1.0)),
+            rate_limit=TokenBucket(
+                redis_client, rate=rate, burst=int(config.get("SEARCH_RATE_LIMIT_BURST", 20))
+            ) if rate > 0 else None,
+        )
+
+    async def admit(self, client_id: str) -> Optional[Rejection]:
+        """None if a search from ``client_id`` may be enqueued now, else why not and when to retry."""
+        if self.rate_limit is not None:
+            wait = await self.rate_limit.acquire(client_id)
+            if wait is not None:
+                return Rejection("Too many search requests.", max(1, math.ceil(wait)))
+
+        stats = await self.queue_stats()
+        if (
+            (self.max_length and stats.length >= self.max_length)
+            or (self.max_lag and stats.lag >= self.max_lag)
+            or (self.max_pending and stats.pending >= self.max_pending)
+        ):
+            return Rejection("Search service is busy, please retry later.", self.retry_after)
+        return None
+
+    async def queue_stats(self) -> QueueStats:
+        """Length, consumer lag and pending count of the stream, refreshed every ``check_interval`` seconds."""
+        if time.monotonic() - self._checked_at < self.check_interval or self._lock.locked():
+            return self._stats
+        async with self._lock:
+            try:
+                self._stats = await self._read_stats()
+            except Exception as exc:  # pragma: no cover - defensive guardrail
+                log.warning("Could not read search queue stats: %s", exc)
+            self._checked_at = time.monotonic()
+        return self._stats
+
+    async def _read_stats(self) -> QueueStats:
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.xlen(self.stream)
+            pipe.xinfo_groups(self.stream)
+            length, groups = await pipe.execute(raise_on_error=False)
+        if isinstance(length, Exception):
+            raise length
+        if isinstance(groups, Exception):
+            # No consumer group yet: nothing has been read, so everything is lag.
+            return QueueStats(length, length, 0)
+        group = next((group for group in groups if group["name"] == self.group), None)
+        if group is None:
+            return QueueStats(length, length, 0)
+        # Redis reports no lag when it cannot compute it, e.g. after XDEL; the pending limit still applies.
+        return QueueStats(length, group.get("lag") or 0, group["pending"])
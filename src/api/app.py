@@ -9,12 +9,22 @@ import redis.asyncio as redis
 from apscheduler.schedulers import asyncio as apscheduler
 
 from src.api.routes import search
+from src.worker import leader
 from src.worker import scheduler as scheduler_worker
+from src.worker import service
 from src.worker import worker
 from src.api.routes import exchange_rates
+from src.api.routes import metrics as metrics_routes
+from src.api import admission
 from src.api import dependencies
-from src.client.alpha import client as alpha_client
-from src.client.betta import client as betta_client
+from src.api import events
+from src.api import metrics as api_metrics
+from src.api import rates as rates_cache
+from src.api import views
+from src.client.nationalbank import client as national_bank_client
+from src.storage import results as result_storage
+from src.telemetry import metrics
+from src.telemetry import tracing
 
 log = logging.getLogger("uvicorn.error")
 
@@ -28,31 +38,63 @@ async def lifespan(app: FastAPI):
         config.get("REDIS_URL", "redis://localhost:6379/0"),
         decode_responses=True
     )
-    app.state.redis = redis.Redis(connection_pool=redis_pool)
+    app.state.redis = metrics.InstrumentedRedis(connection_pool=redis_pool)
     log.info("Redis connection pool created.")
 
-    nb_client = dependencies.get_national_bank_client(config)
-    app.state.alpha_client = alpha_client.AlphaClient(config)
-    app.state.betta_client = betta_client.BettaClient(config)
+    nb_client = national_bank_client.NationalBankClient(config)
+    app.state.nb_client = nb_client
+    app.state.providers = service.create_search_clients(app.state.redis, config)
+    await asyncio.gather(*(provider.warm_up() for provider in app.state.providers.values()))
+    log.info("Search providers initialized: %s", ", ".join(app.state.providers))
     log.info("National Bank Client initialized.")
 
-    try:
-        rates = nb_client.get_exchange_rates()
-        rates_json = rates.model_dump_json()
-        log.info("Fetched initial exchange rates from National Bank.")
-        await app.state.redis.set("exchange_rates", rates_json)
-        log.info("Initial exchange rates stored in Redis.")
+    await scheduler_worker.ensure_fresh_exchange_rates(
+        app, max_age=float(config.get("EXCHANGE_RATES_MAX_AGE", 3600))
+    )
+
+    app.state.rates = rates_cache.RateTableCache(
+        app.state.redis,
+        check_interval=float(config.get("EXCHANGE_RATES_CHECK_INTERVAL", 30)),
+    )
+    await app.state.rates.start()
+    log.info("Exchange rate table loaded.")
+
+    app.state.rate_history = rates_cache.RateHistory(
+        app.state.redis,
+        max_days=int(config.get("EXCHANGE_RATES_HISTORY_CACHE_DAYS", 64)),
+    )
+
+    app.state.result_store = result_storage.create_result_store(
+        app.state.redis, config, rates=app.state.rates.get
+    )
 
-    except Exception as e:
-        log.error(f"Error fetching initial exchange rates: {str(e)}")   
+    app.state.trace_store = tracing.TraceStore(app.state.redis, ttl=app.state.result_store.ttl)
 
+    app.state.admission = admission.AdmissionController.from_config(
+        app.state.redis, config, stream=worker.ACTION_SEARCH_TICKET_IN, group=worker.CONSUMER_GROUP
+    )
+
+    app.state.search_events = events.SearchEventHub(app.state.redis)
+    await app.state.search_events.start()
+
+    app.state.result_views = views.ConvertedViewCache(
+        max_entries=int(config.get("RESULT_VIEW_CACHE_SIZE", 1024)),
+        max_bytes=int(config.get("RESULT_VIEW_CACHE_MB", 64)) * 1024 * 1024,
+    )
+
+    # Every replica runs the scheduler, but only the lease holder executes its jobs.
+    app.state.scheduler_lease = leader.LeaderLease(
+        app.state.redis,
+        ttl_ms=int(config.get("SCHEDULER_LEASE_TTL_MS", 30_000)),
+    )
+    await app.state.scheduler_lease.start()
 
     scheduler = apscheduler.AsyncIOScheduler()
     scheduler.start()
     log.info("Scheduler started.")
 
     scheduler.add_job(
-        scheduler_worker.refresh_exchange_rates_job, 
+        app.state.scheduler_lease.leader_only(scheduler_worker.refresh_exchange_rates_job), 
         "cron", 
         hour=12,
         minute=0,
@@ -61,27 +103,38 @@ async def lifespan(app: FastAPI):
 
     app.state.scheduler = scheduler
 
-    app.state.search_consumer = asyncio.create_task(
-        worker.search_requests_consumer(
-            redis_client=app.state.redis,
-            alpha_client=app.state.alpha_client,
-            betta_client=app.state.betta_client,
+    app.state.search_consumer = None
+    if config.get("SEARCH_CONSUMER_ENABLED", "true").lower() in ("1", "true", "yes"):
+        consumer = service.create_consumer(
+            app.state.redis,
+            config,
+            app.state.providers,
+            result_store=app.state.result_store,
+            rates=app.state.rates,
         )
-    )
-    log.info("Search request consumer task started.")
+        app.state.search_consumer = asyncio.create_task(consumer.start())
+        log.info("Search request consumer task started.")
+    else:
+        log.info("Search request consumer disabled; run worker.py to process searches.")
 
 
     yield  # The application is now running
     
 
     # On shutdown: stop background workers first
-    app.state.search_consumer.cancel()
-    with contextlib.suppress(asyncio.CancelledError):
-        await app.state.search_consumer
-    log.info("Search request consumer stopped.")
-
-    await app.state.alpha_client.close()
-    await app.state.betta_client.close()
+    if app.state.search_consumer is not None:
+        app.state.search_consumer.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await app.state.search_consumer
+        log.info("Search request consumer stopped.")
+
+    await app.state.rates.stop()
+    await app.state.search_events.stop()
+    await app.state.scheduler_lease.stop()
+
+    for provider in app.state.providers.values():
+        await provider.close()
+    await app.state.nb_client.close()
     log.info("Provider clients closed.")
     
     await app.state.redis.aclose()
@@ -110,10 +163,12 @@ def create_app() -> FastAPI:
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    app.add_middleware(api_metrics.MetricsMiddleware)
 
     # Include routers
     app.include_router(exchange_rates.router, prefix="/api/v1", tags=["exchange-rates"])
     app.include_router(search.router, prefix="/api/v1")
+    app.include_router(metrics_routes.router)
 
 
     @app.get("/")
@@ -4,12 +4,17 @@ import os
 from functools import lru_cache
 
 from dotenv import dotenv_values
-from fastapi import Depends
 import fastapi
 import redis.asyncio as redis
 
 from src.client.nationalbank.client import NationalBankClient
-from src.client.alpha.client import AlphaClient
+from src.client.cache import CachedProviderClient
+from src.api.admission import AdmissionController
+from src.api.rates import RateHistory, RateTableCache
+from src.api.events import SearchEventHub
+from src.api.views import ConvertedViewCache
+from src.storage.results import ResultStore
+from src.telemetry.tracing import TraceStore
 
 @lru_cache
 def get_config() -> dict[str, str]:
@@ -17,11 +22,32 @@ def get_config() -> dict[str, str]:
     return {**file_config, **os.environ}
 
 
-def get_national_bank_client(config: dict[str, str] = Depends(get_config)) -> "NationalBankClient":
-    return NationalBankClient(config)
+def get_national_bank_client(request: fastapi.Request) -> "NationalBankClient":
+    return request.app.state.nb_client
 
 def get_redis_client(request: fastapi.Request) -> redis.Redis:
     return request.app.state.redis
 
-def get_provider_alpha_client(request: fastapi.Request) -> "AlphaClient":
-    return request.app.state.alpha_client
\ No newline at end of file
+def get_provider_clients(request: fastapi.Request) -> dict[str, CachedProviderClient]:
+    return request.app.state.providers
+
+def get_rate_table_cache(request: fastapi.Request) -> RateTableCache:
+    return request.app.state.rates
+
+def get_rate_history(request: fastapi.Request) -> RateHistory:
+    return request.app.state.rate_history
+
+def get_result_view_cache(request: fastapi.Request) -> ConvertedViewCache:
+    return request.app.state.result_views
+
+def get_result_store(request: fastapi.Request) -> ResultStore:
+    return request.app.state.result_store
+
+def get_search_events(request: fastapi.Request) -> SearchEventHub:
+    return request.app.state.search_events
+
+def get_admission(request: fastapi.Request) -> AdmissionController:
+    return request.app.state.admission
+
+def get_trace_store(request: fastapi.Request) -> TraceStore:
+    return request.app.state.trace_store
@@ -0,0 +1,80 @@
+import asyncio
+import contextlib
+import json
+import logging
+from typing import Iterator
+
+import redis.asyncio as redis
+
+from src.storage.results import SEARCH_EVENTS_PREFIX
+
+
+log = logging.getLogger("uvicorn.error")
+
+
+class SearchEventHub:
+    """Fans the worker's search notifications out to the requests waiting on them.
+
+    Each process holds a single pattern subscription; waiting requests park on
+    an asyncio queue, so idle clients cost neither CPU nor Redis connections.
+    """
+
+    def __init__(self, redis_client: redis.Redis, *, retry_interval: float = 1.0) -> None:
+        self.redis_client = redis_client
+        self.retry_interval = retry_interval
+        self._waiters: dict[str, set[asyncio.Queue]] = {}
+        self._listener: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._listener
+
+    @contextlib.contextmanager
+    def subscribe(self, search_id: str) -> Iterator[asyncio.Queue]:
+        """Queue receiving the events of ``search_id`` while the block runs.
+
+        Subscribe before reading the search so no write can slip in between.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        self._waiters.setdefault(search_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            waiters = self._waiters.get(search_id)
+            if waiters is not None:
+                waiters.discard(queue)
+                if not waiters:
+                    del self._waiters[search_id]
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async with self.redis_client.pubsub() as pubsub:
+                    await pubsub.psubscribe(f"{SEARCH_EVENTS_PREFIX}:*")
+                    while True:
+                        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=None)
+                        if message is not None:
+                            self._deliver(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # pragma: no cover - defensive guardrail
+                log.error("Search event listener failed: %s", exc)
+                await asyncio.sleep(self.retry_interval)
+
+    def _deliver(self, message: dict) -> None:
+        search_id = message["channel"].removeprefix(f"{SEARCH_EVENTS_PREFIX}:")
+        waiters = self._waiters.get(search_id)
+        if not waiters:
+            return
+        try:
+            event = json.loads(message["data"])
+        except ValueError:
+            log.warning("Ignoring malformed event for search %s", search_id)
+            return
+        for queue in waiters:
+            queue.put_nowait(event)
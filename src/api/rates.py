@@ -0,0 +1,268 @@
+import asyncio
+import contextlib
+import datetime
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+
+import redis.asyncio as redis
+
+from src.reqresp import national_bank
+
+
+log = logging.getLogger("uvicorn.error")
+
+
+EXCHANGE_RATES_KEY = "exchange_rates"
+EXCHANGE_RATES_VERSION_KEY = "exchange_rates:version"
+EXCHANGE_RATES_CHANNEL = "exchange_rates:updates"
+EXCHANGE_RATES_HISTORY_KEY = "exchange_rates:history"
+EXCHANGE_RATES_FETCHED_AT_KEY = "exchange_rates:fetched_at"
+BASE_CURRENCY = "KZT"
+
+
+@dataclass(frozen=True, slots=True)
+class RateTable:
+    """Immutable snapshot of exchange rates with every cross rate precomputed."""
+
+    version: int
+    rates: Mapping[str, float]
+    cross: Mapping[tuple[str, str], float]
+    currencies: tuple[tuple[str, str], ...]
+
+    @classmethod
+    def from_response(cls, response: national_bank.NationalBankResponse, version: int) -> "RateTable":
+        return cls.from_rates(
+            {curr.title: curr.description for curr in response.rate.currencies},
+            version,
+            currencies=tuple((curr.title, curr.full_name) for curr in response.rate.currencies),
+        )
+
+    @classmethod
+    def from_rates(
+        cls,
+        kzt_rates: Mapping[str, float],
+        version: int,
+        *,
+        currencies: tuple[tuple[str, str], ...] = (),
+    ) -> "RateTable":
+        """Build a table from KZT-per-unit rates keyed by currency code."""
+        rates = {BASE_CURRENCY: 1.0}
+        for code, rate in kzt_rates.items():
+            if rate > 0:
+                rates[code.upper()] = rate
+
+        cross = {
+            (source, target): source_rate / target_rate
+            for source, source_rate in rates.items()
+            for target, target_rate in rates.items()
+        }
+        return cls(
+            version=version,
+            rates=MappingProxyType(rates),
+            cross=MappingProxyType(cross),
+            currencies=currencies,
+        )
+
+    def supports(self, currency: str) -> bool:
+        return currency.upper() in self.rates
+
+    def factor(self, source: str, target: str) -> float | None:
+        """Multiplier converting an amount in ``source`` to ``target``, or None if unknown."""
+        return self.cross.get((source.upper(), target.upper()))
+
+
+def rates_date(response: national_bank.NationalBankResponse) -> datetime.date:
+    """Publication date of a bank response, falling back to today if it is missing or malformed."""
+    try:
+        return datetime.datetime.strptime(response.rate.date, "%d.%m.%Y").date()
+    except ValueError:
+        return datetime.date.today()
+
+
+def encode_rates(response: national_bank.NationalBankResponse) -> str:
+    """Compact ``CODE=rate`` list used for the per-date history, e.g. ``USD=505.5,EUR=545.1``."""
+    return ",".join(
+        f"{curr.title.upper()}={curr.description!r}"
+        for curr in response.rate.currencies
+        if curr.description > 0
+    )
+
+
+def decode_rates(encoded: str) -> dict[str, float]:
+    rates = {}
+    for pair in encoded.split(","):
+        code, _, rate = pair.partition("=")
+        if code:
+            rates[code] = float(rate)
+    return rates
+
+
+async def store_exchange_rates(
+    redis_client: redis.Redis,
+    rates: national_bank.NationalBankResponse,
+) -> int:
+    """Write new rates, bump their version and notify every process holding a RateTable.
+
+    The rates are also recorded in the per-date history under their publication date.
+    """
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.set(EXCHANGE_RATES_KEY, rates.model_dump_json())
+    pipe.hset(EXCHANGE_RATES_HISTORY_KEY, rates_date(rates).isoformat(), encode_rates(rates))
+    pipe.incr(EXCHANGE_RATES_VERSION_KEY)
+    pipe.set(EXCHANGE_RATES_FETCHED_AT_KEY, time.time())
+    _, _, version, _ = await pipe.execute()
+    await redis_client.publish(EXCHANGE_RATES_CHANNEL, version)
+    return int(version)
+
+
+async def exchange_rates_age(redis_client: redis.Redis) -> float | None:
+    """Seconds since rates were last stored, or None if they never were."""
+    fetched_at = await redis_client.get(EXCHANGE_RATES_FETCHED_AT_KEY)
+    if fetched_at is None or not await redis_client.exists(EXCHANGE_RATES_KEY):
+        return None
+    return max(0.0, time.time() - float(fetched_at))
+
+
+class RateTableCache:
+    """Per-process RateTable that is reloaded only when the rates version in Redis changes.
+
+    Updates are announced on a pub/sub channel; the version key is also checked
+    every ``check_interval`` seconds in case a notification was missed.
+    """
+
+    def __init__(self, redis_client: redis.Redis, *, check_interval: float = 30.0) -> None:
+        self.redis_client = redis_client
+        self.check_interval = check_interval
+        self._table: RateTable | None = None
+        self._listener: asyncio.Task | None = None
+
+    def get(self) -> RateTable | None:
+        return self._table
+
+    async def load(self) -> RateTable | None:
+        """Return the current table, reading it from Redis if none has been loaded yet."""
+        return self._table or await self.reload()
+
+    async def reload(self) -> RateTable | None:
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.get(EXCHANGE_RATES_VERSION_KEY)
+        pipe.get(EXCHANGE_RATES_KEY)
+        version, payload = await pipe.execute()
+        if payload is None:
+            return self._table
+
+        version = int(version or 0)
+        if self._table is None or self._table.version != version:
+            response = national_bank.NationalBankResponse.model_validate_json(payload)
+            self._table = RateTable.from_response(response, version)
+            log.info("Loaded exchange rate table version %s", version)
+        return self._table
+
+    async def _refresh_if_changed(self) -> None:
+        version = await self.redis_client.get(EXCHANGE_RATES_VERSION_KEY)
+        if self._table is None or int(version or 0) != self._table.version:
+            await self.reload()
+
+    async def start(self) -> None:
+        await self.reload()
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._listener
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async with self.redis_client.pubsub() as pubsub:
+                    await pubsub.subscribe(EXCHANGE_RATES_CHANNEL)
+                    while True:
+                        await pubsub.get_message(
+                            ignore_subscribe_messages=True,
+                            timeout=self.check_interval,
+                        )
+                        await self._refresh_if_changed()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # pragma: no cover - defensive guardrail
+                log.error("Exchange rate listener failed: %s", exc)
+                await asyncio.sleep(self.check_interval)
+
+
+class RateHistory:
+    """Exchange rates by date, read from the Redis history hash through an in-memory LRU."""
+
+    def __init__(self, redis_client: redis.Redis, *, max_days: int = 64) -> None:
+        self.redis_client = redis_client
+        self.max_days = max_days
+        self._tables: OrderedDict[datetime.date, RateTable] = OrderedDict()
+
+    async def get(self, day: datetime.date) -> RateTable | None:
+        table = self._tables.get(day)
+        if table is not None:
+            self._tables.move_to_end(day)
+            return table
+
+        encoded = await self.redis_client.hget(EXCHANGE_RATES_HISTORY_KEY, day.isoformat())
+        if encoded is None:
+            return None
+        return self._remember(day, decode_rates(encoded))
+
+    async def get_or_fetch(self, day: datetime.date, nb_client) -> RateTable | None:
+        """Like ``get``, but asks the bank once for a date missing from the history."""
+        table = await self.get(day)
+        if table is not None or day > datetime.date.today():
+            return table
+
+        response = await nb_client.get_exchange_rates(day)
+        if not response.rate.currencies:
+            return None
+        await self.redis_client.hset(EXCHANGE_RATES_HISTORY_KEY, day.isoformat(), encode_rates(response))
+        return self._remember(day, decode_rates(encode_rates(response)))
+
+    async def backfill(self, nb_client, start_date: datetime.date, end_date: datetime.date) -> int:
+        """Fetch and store every missing date in ``[start_date, end_date]``; returns the number stored."""
+        days = [
+            start_date + datetime.timedelta(days=offset)
+            for offset in range((end_date - start_date).days + 1)
+        ]
+        if not days:
+            return 0
+
+        existing = await self.redis_client.hmget(EXCHANGE_RATES_HISTORY_KEY, [day.isoformat() for day in days])
+        missing = [day for day, encoded in zip(days, existing) if encoded is None]
+        if not missing:
+            return 0
+
+        # Fetch contiguous spans so the client can run each one concurrently.
+        fetched: dict[datetime.date, national_bank.NationalBankResponse] = {}
+        span_start = previous = missing[0]
+        for day in missing[1:] + [None]:
+            if day is not None and day - previous == datetime.timedelta(days=1):
+                previous = day
+                continue
+            fetched.update(await nb_client.get_exchange_rates_range(span_start, previous))
+            if day is not None:
+                span_start = previous = day
+
+        mapping = {
+            day.isoformat(): encode_rates(response)
+            for day, response in fetched.items()
+            if response.rate.currencies
+        }
+        if mapping:
+            await self.redis_client.hset(EXCHANGE_RATES_HISTORY_KEY, mapping=mapping)
+        return len(mapping)
+
+    def _remember(self, day: datetime.date, kzt_rates: Mapping[str, float]) -> RateTable:
+        table = RateTable.from_rates(kzt_rates, version=day.toordinal())
+        self._tables[day] = table
+        while len(self._tables) > self.max_days:
+            self._tables.popitem(last=False)
+        return table
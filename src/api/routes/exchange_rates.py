@@ -5,9 +5,9 @@ from typing import Optional
 from dotenv import dotenv_values
 import redis.asyncio as redis
 
-from src.reqresp.national_bank import NationalBankResponse
 from src.client.nationalbank import client
-from src.api.dependencies import get_national_bank_client, get_redis_client
+from src.api.dependencies import get_national_bank_client, get_rate_history, get_rate_table_cache, get_redis_client
+from src.api.rates import RateHistory, RateTableCache, store_exchange_rates
 
 log = logging.getLogger("uvicorn.error")
 
@@ -18,32 +18,69 @@ router = APIRouter()
 async def list_available_currencies(
     nb_client: client.NationalBankClient = Depends(get_national_bank_client),
     redis_client: redis.Redis = Depends(get_redis_client),
+    rates_cache: RateTableCache = Depends(get_rate_table_cache),
 ):
     """
     Get list of all available currencies
     """
     try:
-        cached_rates = await redis_client.get("exchange_rates")
-        log.info("Fetched exchange rates from Redis cache.")
-    
-        if not cached_rates:
+        table = await rates_cache.load()
+
+        if table is None:
             log.info("No cached rates found in Redis. Fetching from National Bank.")
-            rates_response = nb_client.get_exchange_rates()  # Fetch and cache if not present
-            cached_rates = rates_response.model_dump_json()
-            await redis_client.set("exchange_rates", cached_rates)
+            rates_response = await nb_client.get_exchange_rates()  # Fetch and cache if not present
+            await store_exchange_rates(redis_client, rates_response)
             log.info("Stored fetched exchange rates in Redis cache.")
-
-        rates_response = NationalBankResponse.model_validate_json(cached_rates)
+            table = await rates_cache.reload()
 
         currencies = [
             {
-                "code": curr.title,
-                "name": curr.full_name
+                "code": code,
+                "name": name
             }
-            for curr in rates_response.rate.currencies
+            for code, name in table.currencies
         ]
         
         return {"currencies": currencies, "count": len(currencies)}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching currencies: {str(e)}")
+
+
+@router.get("/exchange-rates/convert")
+async def convert_amount(
+    amount: float = Query(..., description="Amount to convert"),
+    from_currency: str = Query(..., alias="from", description="Source currency code"),
+    to_currency: str = Query(..., alias="to", description="Target currency code"),
+    on_date: Optional[date] = Query(None, alias="date", description="Use the rates published on this date"),
+    nb_client: client.NationalBankClient = Depends(get_national_bank_client),
+    rates_cache: RateTableCache = Depends(get_rate_table_cache),
+    rate_history: RateHistory = Depends(get_rate_history),
+):
+    """
+    Convert an amount using current rates, or the rates of a given date
+    """
+    if on_date is None:
+        table = await rates_cache.load()
+    else:
+        try:
+            table = await rate_history.get_or_fetch(on_date, nb_client)
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"Error fetching exchange rates for {on_date}: {str(e)}")
+
+    if table is None:
+        raise HTTPException(status_code=404, detail=f"No exchange rates available for {on_date or 'today'}")
+
+    factor = table.factor(from_currency, to_currency)
+    if factor is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported currency conversion for {from_currency} to {to_currency}",
+        )
+
+    return {
+        "amount": round(amount * factor, 2),
+        "currency": to_currency.upper(),
+        "rate": factor,
+        "date": on_date,
+    }
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from src.api import admission as search_admission
+from src.api import dependencies
+from src.telemetry import metrics
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics(
+    admission: search_admission.AdmissionController = Depends(dependencies.get_admission),
+):
+    """Prometheus metrics of this process, plus the search queue gauges."""
+    stats = await admission.queue_stats()
+    metrics.SEARCH_STREAM_LENGTH.set(stats.length)
+    metrics.SEARCH_CONSUMER_LAG.set(stats.lag)
+    metrics.SEARCH_PENDING.set(stats.pending)
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=CONTENT_TYPE)
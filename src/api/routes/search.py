@@ -1,16 +1,39 @@
 
+import asyncio
+import contextlib
+import json
 import logging
+from datetime import date
+from typing import AsyncIterator, List, Literal, Optional, Sequence
 from uuid import uuid4
 
 import redis.asyncio as redis
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 
+from src.api import admission as search_admission
 from src.api import dependencies
+from src.api import events
+from src.api import rates
+from src.api.views import COMPRESSORS, ConvertedViewCache, EncodedView
+from src.client.nationalbank.client import NationalBankClient
+from src.reqresp import compact
 from src.reqresp import search
-from src.reqresp import national_bank
+from src.reqresp.price_column import PriceColumn
+from src.storage import index as result_index
+from src.storage import results as result_storage
+from src.telemetry import tracing
 
 
 ACTION_SEARCH_TICKET_IN = "action.search-tickets.in"
+SORT_KEYS = result_index.SORT_KEYS
+MAX_PAGE_SIZE = 500
+MAX_WAIT = 60
+# Seconds between keep-alive comments on an idle event stream; the search status is re-checked each time.
+EVENTS_KEEPALIVE = 15
+# Seconds an event stream waits for a just-queued search to be picked up before answering 404.
+EVENTS_START_WAIT = 5
+UNFINISHED = (search.SearchStatus.PENDING, search.SearchStatus.PARTIAL)
 
 
 router = APIRouter(tags=["search"])
@@ -19,15 +42,36 @@ log = logging.getLogger("uvicorn.error")
 
 @router.post("/search", response_model=search.SearchResponse)
 async def search_tickets(
+    http_request: Request,
+    criteria: Optional[search.SearchCriteria] = None,
     client: redis.Redis = Depends(dependencies.get_redis_client),
+    admission: search_admission.AdmissionController = Depends(dependencies.get_admission),
+    config: dict[str, str] = Depends(dependencies.get_config),
 ):
-    """Enqueue a search job for asynchronous processing."""
+    """Enqueue a search job for asynchronous processing.
+
+    Answers 429 with ``Retry-After`` while the client is over its rate limit or
+    the search queue is backed up.
+    """
+    client_id = http_request.client.host if http_request.client else "unknown"
+    rejection = await admission.admit(client_id)
+    if rejection is not None:
+        log.warning("Rejected search request from %s: %s", client_id, rejection.reason)
+        raise HTTPException(
+            status_code=429,
+            detail=rejection.reason,
+            headers={"Retry-After": str(rejection.retry_after)},
+        )
+
     search_id = str(uuid4())
-    request = search.RedisSearchRequest(search_id=search_id)
+    request = search.RedisSearchRequest(search_id=search_id, criteria=criteria)
 
+    maxlen = int(config.get("SEARCH_STREAM_MAXLEN", 10_000))
     response: redis.ResponseT = await client.xadd(
         name=ACTION_SEARCH_TICKET_IN,
-        fields=request.model_dump(),
+        fields=request.to_stream_fields(),
+        maxlen=maxlen or None,
+        approximate=True,
     )
     log.info("Published search request %s to stream %s", search_id, ACTION_SEARCH_TICKET_IN)
 
@@ -46,69 +90,354 @@ async def search_tickets(
     )
 
 
+@router.get("/search/{search_id}/trace")
+async def get_search_trace(
+    search_id: str,
+    traces: tracing.TraceStore = Depends(dependencies.get_trace_store),
+):
+    """Timeline of a sampled search: queueing, provider requests and decoding, storage writes and the ack.
+
+    Span times are milliseconds since the search was enqueued.
+    """
+    document = await traces.load(search_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail="No trace recorded for this search")
+    return tracing.expand_spans(document)
+
+
 @router.get(
     "/results/{search_id}/{currency}",
     response_model=search.SearchResponse,
 )
 async def get_search_results(
+    http_request: Request,
     search_id: str,
     currency: str,
-    client: redis.Redis = Depends(dependencies.get_redis_client),
+    rates_date: Optional[date] = Query(
+        None,
+        description="Convert with the rates published on this date, e.g. the date of the search's created_at",
+    ),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Maximum number of items to return"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    sort: Optional[Literal[SORT_KEYS]] = Query(None, description="Sort by price, total duration or first departure"),
+    airline: Optional[List[str]] = Query(None, description="Only offers validated by these airlines"),
+    stops: Optional[int] = Query(None, ge=0, description="Only offers with at most this many stops per flight"),
+    refundable: Optional[bool] = Query(None, description="Only refundable or only non-refundable offers"),
+    wait: float = Query(
+        0,
+        ge=0,
+        le=MAX_WAIT,
+        description="Seconds to hold the request until an unfinished search has new results",
+    ),
+    store: result_storage.ResultStore = Depends(dependencies.get_result_store),
+    rates_cache: rates.RateTableCache = Depends(dependencies.get_rate_table_cache),
+    rate_history: rates.RateHistory = Depends(dependencies.get_rate_history),
+    nb_client: NationalBankClient = Depends(dependencies.get_national_bank_client),
+    views: ConvertedViewCache = Depends(dependencies.get_result_view_cache),
+    search_events: events.SearchEventHub = Depends(dependencies.get_search_events),
 ):
     """Return cached search results for a given search ID."""
-    redis_key = f"search_results:{search_id}"
-    cached = await client.json().get(redis_key, "$")
+    query = result_index.ResultQuery(
+        sort=sort,
+        airlines=tuple(code.upper() for code in airline or ()),
+        max_stops=stops,
+        refundable=refundable,
+        offset=_decode_cursor(cursor),
+        limit=limit,
+    )
+    paged = limit is not None or cursor is not None or sort is not None or query.filtered
+    target = currency.upper()
+
+    # Completed searches already encoded with the current rates are answered without touching Redis.
+    if not paged and rates_date is None:
+        current = rates_cache.get()
+        view = views.get(search_id, target, current.version) if current is not None else None
+        if view is not None:
+            return _view_response(view, http_request)
 
-    if not cached:
+    if wait:
+        # Subscribe before the first read so a write in between still wakes us up.
+        with search_events.subscribe(search_id) as updates:
+            result = await _read_result(store, search_id, items=not paged)
+            if result is None or result.status in UNFINISHED:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(updates.get(), wait)
+                result = await _read_result(store, search_id, items=not paged)
+    else:
+        result = await _read_result(store, search_id, items=not paged)
+
+    if result is None:
         raise HTTPException(
             status_code=404,
             detail="Search results not found or still processing.",
         )
 
-    try:
-        payload = cached[0] if isinstance(cached, list) else cached
-        result = search.SearchResponse.model_validate(payload)
+    if result.status not in (search.SearchStatus.PARTIAL, search.SearchStatus.COMPLETED):
+        return _to_model(result)
 
-    except Exception as exc:  # pragma: no cover - defensive guardrail
-        log.error("Failed to deserialize cached results for %s: %s", search_id, exc)
-        raise HTTPException(status_code=500, detail="Corrupted cached search results") from exc
-    
-    if result.status != search.SearchStatus.COMPLETED:
-        return result
-    
-    cached_currencies = await client.get("exchange_rates")
-    national_bank_response = national_bank.NationalBankResponse.model_validate_json(cached_currencies)
-    currency_map = {}
-    for curr in national_bank_response.rate.currencies:
-        currency_map[curr.title] = curr.description
-
-    if currency.upper() not in currency_map and currency.upper() != "KZT":
+    if rates_date is None:
+        table = await rates_cache.load()
+        if table is None:
+            raise HTTPException(status_code=503, detail="Exchange rates are not available yet")
+    else:
+        try:
+            table = await rate_history.get_or_fetch(rates_date, nb_client)
+        except Exception as exc:
+            log.error("Failed to fetch exchange rates for %s: %s", rates_date, exc)
+            raise HTTPException(
+                status_code=502,
+                detail=f"Could not fetch exchange rates for {rates_date} from the National Bank",
+            ) from exc
+        if table is None:
+            raise HTTPException(status_code=404, detail=f"No exchange rates published for {rates_date}")
+
+    if not table.supports(target):
         raise HTTPException(
             status_code=400,
             detail=f"Unsupported target currency: {currency}",
         )
 
-    for item in result.items or []:
-        rate_for_currency = currency_map.get(item.pricing.currency.upper())
-        if not rate_for_currency and item.pricing.currency.upper() != "KZT":
-            raise HTTPException(
-                status_code=400,
-                detail=f"Unsupported currency conversion for {item.pricing.currency} to {currency}",
-            )
-        if item.pricing.currency.upper() == "KZT":
-            rate_for_currency = 1.0
-
-        amount_in_kzt: float = item.pricing.total * rate_for_currency
-        converted_amount: float = amount_in_kzt
-    
-        if currency.upper() != "KZT":
-            converted_amount: float = amount_in_kzt / currency_map[currency.upper()]
-        
-        item.price = search.Price(
-            amount=round(converted_amount, 2),
-            currency=currency.upper()
-        )
+    if paged:
+        page = _to_model(result)
+        await _fill_page(store, table, page, query, target)
+        log.info("Returning %s results for search %s (requested currency %s)", len(page.items), search_id, currency)
+        return page
 
+    amounts = _convert(PriceColumn.from_offers(result.items), table, target)
+    view = EncodedView(_encode_view(result, amounts, target))
+    # Historical conversions are rare and partial results still change; only final current-rate views are cached.
+    if result.status == search.SearchStatus.COMPLETED and rates_date is None:
+        views.put(search_id, target, table.version, view.precompress(), await store.expires_in(search_id))
 
     log.info("Returning results for search %s (requested currency %s)", search_id, currency)
-    return result
\ No newline at end of file
+    return _view_response(view, http_request)
+
+
+@router.get("/results/{search_id}/{currency}/events")
+async def stream_search_results(
+    search_id: str,
+    currency: str,
+    store: result_storage.ResultStore = Depends(dependencies.get_result_store),
+    rates_cache: rates.RateTableCache = Depends(dependencies.get_rate_table_cache),
+    search_events: events.SearchEventHub = Depends(dependencies.get_search_events),
+):
+    """Stream a search's results as Server-Sent Events while the worker produces them.
+
+    ``items`` events carry new or replaced offers with their positions, ``status``
+    events the search and provider statuses; the stream ends once the search has
+    finished or its results have expired.
+    """
+    table = await rates_cache.load()
+    if table is None:
+        raise HTTPException(status_code=503, detail="Exchange rates are not available yet")
+    target = currency.upper()
+    if not table.supports(target):
+        raise HTTPException(status_code=400, detail=f"Unsupported target currency: {currency}")
+
+    # A search that was only just queued is stored once a worker picks it up.
+    with search_events.subscribe(search_id) as updates:
+        status = await _read_result(store, search_id, items=False)
+        if status is None:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(updates.get(), EVENTS_START_WAIT)
+            status = await _read_result(store, search_id, items=False)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Search results not found")
+
+    return StreamingResponse(
+        _result_events(store, search_events, table, search_id, target),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _result_events(
+    store: result_storage.ResultStore,
+    search_events: events.SearchEventHub,
+    table: rates.RateTable,
+    search_id: str,
+    target: str,
+) -> AsyncIterator[str]:
+    sent = 0
+    with search_events.subscribe(search_id) as updates:
+        stored = await store.read(search_id)
+        if stored is None:
+            return
+        while True:
+            if stored is not None:
+                # Initial snapshot, or catching up after the search finished unannounced.
+                positions = range(sent, len(stored.items))
+                if positions:
+                    yield _sse("items", _positioned_items(positions, stored.items[sent:], table, target))
+                sent = max(sent, len(stored.items))
+                providers = {name: status.value for name, status in stored.providers.items()}
+                yield _sse("status", _status_event(stored.status.value, providers, sent))
+                if stored.status not in UNFINISHED:
+                    return
+
+            try:
+                event = await asyncio.wait_for(updates.get(), EVENTS_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                status = await store.read(search_id, items=False)
+                if status is None:
+                    log.info("Results of search %s expired, ending its event stream", search_id)
+                    return
+                finished = status.status not in UNFINISHED
+                stored = await store.read(search_id) if finished else None
+                continue
+            stored = None
+
+            positions = [position for position in event["replaced"] if position < sent]
+            positions += range(sent, event["items"])
+            if positions:
+                offers = await store.read_items(search_id, positions)
+                yield _sse("items", _positioned_items(positions, offers, table, target))
+            sent = max(sent, event["items"])
+            yield _sse("status", _status_event(event["status"], event["providers"], sent))
+            if search.SearchStatus(event["status"]) not in UNFINISHED:
+                return
+
+
+def _positioned_items(
+    positions: Sequence[int],
+    offers: Sequence[compact.CompactOffer],
+    table: rates.RateTable,
+    target: str,
+) -> list[dict]:
+    amounts = PriceColumn.from_offers(offers).convert(table, target)
+    items = []
+    for index, (position, offer) in enumerate(zip(positions, offers)):
+        item = compact.offer_to_dict(offer)
+        if amounts is not None:
+            item["price"] = {"amount": amounts[index], "currency": target}
+        items.append({"position": position, "item": item})
+    return items
+
+
+def _status_event(status: str, providers: dict[str, str], items: int) -> dict:
+    return {"status": status, "providers": providers, "items": items}
+
+
+def _sse(event: str, data: object) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+async def _read_result(
+    store: result_storage.ResultStore,
+    search_id: str,
+    *,
+    items: bool = True,
+) -> Optional[compact.CompactSearch]:
+    try:
+        return await store.read(search_id, items=items)
+
+    except Exception as exc:  # pragma: no cover - defensive guardrail
+        log.error("Failed to deserialize cached results for %s: %s", search_id, exc)
+        raise HTTPException(status_code=500, detail="Corrupted cached search results") from exc
+
+
+def _to_model(result: compact.CompactSearch) -> search.SearchResponse:
+    return search.SearchResponse.model_validate(result.to_document())
+
+
+def _encode_view(result: compact.CompactSearch, amounts: Sequence[float], target: str) -> bytes:
+    """The ``SearchResponse`` JSON with every item priced in ``target``, built from the stored offers."""
+    document = result.to_document()
+    for item, amount in zip(document.get("items", ()), amounts):
+        # Keep the field order of SearchResult, where price comes before providers.
+        providers = item.pop("providers", None)
+        item["price"] = {"amount": amount, "currency": target}
+        if providers is not None:
+            item["providers"] = providers
+    return json.dumps(document, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def _view_response(view: EncodedView, request: Request) -> Response:
+    headers = {"ETag": view.etag, "Vary": "Accept-Encoding"}
+    if _etag_matches(request.headers.get("if-none-match"), view.etag):
+        return Response(status_code=304, headers=headers)
+    for coding in _accepted_codings(request.headers.get("accept-encoding", "")):
+        body = view.variant(coding)
+        if body is not None:
+            return Response(body, media_type="application/json", headers={**headers, "Content-Encoding": coding})
+    return Response(view.body, media_type="application/json", headers=headers)
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison, as ``If-None-Match`` requires."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def _accepted_codings(accept_encoding: str) -> list[str]:
+    """Supported content codings the client accepts, in our order of preference."""
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        weight = 1.0
+        name, _, value = params.strip().partition("=")
+        if name.strip().lower() == "q":
+            try:
+                weight = float(value)
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip().lower()] = weight
+    return [coding for coding in COMPRESSORS if weights.get(coding, weights.get("*", 0.0)) > 0]
+
+
+def _decode_cursor(cursor: Optional[str]) -> int:
+    if cursor is None:
+        return 0
+    try:
+        offset = int(cursor)
+    except ValueError:
+        offset = -1
+    if offset < 0:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor}")
+    return offset
+
+
+async def _fill_page(
+    store: result_storage.ResultStore,
+    table: rates.RateTable,
+    result: search.SearchResponse,
+    query: result_index.ResultQuery,
+    target: str,
+) -> None:
+    """Put one sorted, filtered page of items into ``result``, read through the indexes when the search has them."""
+    search_id = str(result.search_id)
+    page = None
+    if result.status == search.SearchStatus.COMPLETED:
+        page = await store.index.query(search_id, query)
+
+    if page is not None:
+        offers = await store.read_items(search_id, page.positions)
+    else:
+        # Partial searches (and ones indexed without a rates table) are sorted and filtered in memory.
+        stored = await store.read(search_id)
+        offers = stored.items if stored is not None else []
+        prices = _convert(PriceColumn.from_offers(offers), table, target) if query.sort == "price" else None
+        page = query.apply(offers, prices)
+        offers = [offers[position] for position in page.positions]
+
+    result.items = [compact.offer_to_model(offer) for offer in offers]
+    amounts = _convert(PriceColumn.from_offers(offers), table, target)
+    for item, amount in zip(result.items, amounts):
+        item.price = search.Price(amount=amount, currency=target)
+    result.total = page.total
+    result.next_cursor = None if page.next_offset is None else str(page.next_offset)
+
+
+def _convert(column: PriceColumn, table: rates.RateTable, target: str) -> tuple[float, ...]:
+    amounts = column.convert(table, target)
+    if amounts is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported currency conversion for {', '.join(column.unsupported(table, target))} to {target}",
+        )
+    return amounts
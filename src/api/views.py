@@ -0,0 +1,118 @@
+import gzip
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it responses are only gzipped
+    brotli = None
+
+
+ViewKey = tuple[str, str, int]
+
+# Bodies smaller than this are sent uncompressed.
+MIN_COMPRESS_SIZE = 1024
+
+# Content codings in order of preference.
+COMPRESSORS: dict[str, Callable[[bytes], bytes]] = {}
+if brotli is not None:
+    COMPRESSORS["br"] = lambda body: brotli.compress(body, quality=5)
+COMPRESSORS["gzip"] = lambda body: gzip.compress(body, compresslevel=6, mtime=0)
+
+
+class EncodedView:
+    """Final JSON bytes of a converted result, with its ETag and compressed variants."""
+
+    __slots__ = ("body", "etag", "_variants")
+
+    def __init__(self, body: bytes) -> None:
+        self.body = body
+        # Weak, since the compressed variants share it.
+        self.etag = f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        self._variants: dict[str, bytes] = {}
+
+    def variant(self, coding: str) -> Optional[bytes]:
+        """Body compressed with ``coding``, compressed on first use; None if not worth compressing."""
+        if len(self.body) < MIN_COMPRESS_SIZE or coding not in COMPRESSORS:
+            return None
+        encoded = self._variants.get(coding)
+        if encoded is None:
+            encoded = self._variants[coding] = COMPRESSORS[coding](self.body)
+        return encoded
+
+    def precompress(self) -> "EncodedView":
+        for coding in COMPRESSORS:
+            self.variant(coding)
+        return self
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(encoded) for encoded in self._variants.values())
+
+
+class ConvertedViewCache:
+    """LRU of encoded result views keyed by ``(search_id, currency, rates_version)``.
+
+    Entries expire together with their search and are dropped as soon as a
+    newer rates version is seen. Bounded both by entry count and by the bytes
+    of the bodies and their compressed variants.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[ViewKey, tuple[EncodedView, Optional[float], int]] = OrderedDict()
+        self._rates_version: Optional[int] = None
+        self._bytes = 0
+
+    def get(self, search_id: str, currency: str, rates_version: int) -> Optional[EncodedView]:
+        key = (search_id, currency, rates_version)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        view, expires_at, _ = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._remove(key)
+            return None
+
+        self._entries.move_to_end(key)
+        return view
+
+    def put(
+        self,
+        search_id: str,
+        currency: str,
+        rates_version: int,
+        view: EncodedView,
+        ttl: Optional[float] = None,
+    ) -> None:
+        if rates_version != self._rates_version:
+            self.evict_rates_version(rates_version)
+        size = view.size
+        if size > self.max_bytes:
+            return
+
+        key = (search_id, currency, rates_version)
+        if key in self._entries:
+            self._remove(key)
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._entries[key] = (view, expires_at, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def evict_rates_version(self, current_version: int) -> None:
+        """Drop every view converted with rates other than ``current_version``."""
+        self._rates_version = current_version
+        for key in [key for key in self._entries if key[2] != current_version]:
+            self._remove(key)
+
+    def _remove(self, key: ViewKey) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -2,9 +2,6 @@ import logging
 
 import fastapi
 
-from src.reqresp import search
-from src.api import dependencies
-
 log = logging.getLogger("uvicorn.error")
 
 
@@ -15,11 +12,11 @@ async def search_tickets_job(app: fastapi.FastAPI):
     log.info("SCHEDULER: Running scheduled job to search tickets.")
 
     try:
-        alpha_client = dependencies.get_provider_alpha_client(app)
+        alpha_client = app.state.providers["alpha"]
         log.info("SCHEDULER: Alpha Client initialized.")
 
-        search_response: search.AlphaSearchResponse = await alpha_client.search()
-        log.info(f"SCHEDULER: Fetched {len(search_response.root)} tickets from Alpha provider.")
+        offers = await alpha_client.search()
+        log.info(f"SCHEDULER: Fetched {len(offers)} tickets from Alpha provider.")
         
         # Here you can add code to process/store the search_response as needed
 
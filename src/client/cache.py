@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterator
+
+import redis.asyncio as redis
+
+from src.reqresp import compact
+from src.reqresp import search as search_reqresp
+
+
+log = logging.getLogger("uvicorn.error")
+
+PROVIDER_CACHE_PREFIX = "provider_cache"
+
+
+class CachedProviderClient:
+    """Provider client wrapper that caches responses in Redis by normalized search criteria.
+
+    Entries younger than ``ttl`` seconds are served as-is. Entries older than
+    that but within ``stale_ttl`` more seconds are still served, while a
+    background task refreshes them. Anything older is fetched again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        client,
+        redis_client: redis.Redis,
+        *,
+        ttl: int = 300,
+        stale_ttl: int = 600,
+        prefix: str = PROVIDER_CACHE_PREFIX,
+    ) -> None:
+        self.name = name
+        self.client = client
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.prefix = prefix
+        self._refreshing: dict[str, asyncio.Task] = {}
+
+    def _key(self, criteria: search_reqresp.SearchCriteria | None) -> str:
+        return f"{self.prefix}:{self.name}:{search_reqresp.criteria_cache_key(criteria)}"
+
+    async def search(self, criteria: search_reqresp.SearchCriteria | None = None) -> list[compact.CompactOffer]:
+        if self.ttl <= 0:
+            return await self.client.search(criteria)
+
+        key = self._key(criteria)
+        cached = await self._cached(key, criteria)
+        if cached is not None:
+            return cached
+        return await self._fetch(key, criteria)
+
+    async def search_iter(
+        self,
+        criteria: search_reqresp.SearchCriteria | None = None,
+    ) -> AsyncIterator[compact.CompactOffer]:
+        """Replay cached offers, or stream a fresh response and cache it once complete."""
+        if self.ttl <= 0:
+            async for item in self.client.search_iter(criteria):
+                yield item
+            return
+
+        key = self._key(criteria)
+        cached = await self._cached(key, criteria)
+        if cached is not None:
+            for offer in cached:
+                yield offer
+            return
+
+        offers = []
+        async for offer in self.client.search_iter(criteria):
+            offers.append(offer)
+            yield offer
+        await self._store(key, offers)
+
+    async def _cached(
+        self,
+        key: str,
+        criteria: search_reqresp.SearchCriteria | None,
+    ) -> list[compact.CompactOffer] | None:
+        """Cached response if still usable, scheduling a background refresh when it is stale."""
+        cached = await self.redis_client.get(key)
+        if cached is None:
+            return None
+
+        fetched_at, _, payload = cached.partition("|")
+        age = time.time() - float(fetched_at)
+        offers = compact.decode_offers(payload)
+        if age >= self.ttl:
+            log.info("Serving stale %s response (age %.0fs), refreshing", self.name, age)
+            self._schedule_refresh(key, criteria)
+        return offers
+
+    async def _fetch(
+        self,
+        key: str,
+        criteria: search_reqresp.SearchCriteria | None,
+    ) -> list[compact.CompactOffer]:
+        offers = await self.client.search(criteria)
+        await self._store(key, offers)
+        return offers
+
+    async def _store(self, key: str, offers: list[compact.CompactOffer]) -> None:
+        await self.redis_client.set(
+            key,
+            f"{time.time():.3f}|{compact.encode_offers(offers)}",
+            ex=self.ttl + self.stale_ttl,
+        )
+
+    def _schedule_refresh(self, key: str, criteria: search_reqresp.SearchCriteria | None) -> None:
+        if key in self._refreshing:
+            return
+
+        async def _refresh() -> None:
+            try:
+                await self._fetch(key, criteria)
+            except Exception as exc:
+                log.error("Background refresh of %s failed: %s", key, exc)
+
+        task = asyncio.create_task(_refresh())
+        self._refreshing[key] = task
+        task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+
+    async def warm_up(self) -> None:
+        await self.client.warm_up()
+
+    async def close(self) -> None:
+        for task in list(self._refreshing.values()):
+            task.cancel()
+        await self.client.close()
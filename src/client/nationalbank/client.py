@@ -1,36 +1,141 @@
+import asyncio
 import datetime
-import requests
+import logging
+import random
+
+import aiohttp
 import xmltodict
 
 from src.reqresp import national_bank
 
 
+log = logging.getLogger("uvicorn.error")
+
+# Statuses worth retrying; anything else in the 4xx range is a caller error.
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
 class NationalBankClient:
-    def get_exchange_rates(self, to_date=datetime.date.today()) -> national_bank.NationalBankRate:
+    async def get_exchange_rates(self, to_date: datetime.date | None = None) -> national_bank.NationalBankResponse:
+        to_date = to_date or datetime.date.today()
         request_url = f"{self.base_url}?fdate={to_date.strftime('%d.%m.%Y')}"
-        print(f"Requesting URL: {request_url}")
+        log.info("Requesting URL: %s", request_url)
+
+        headers = {}
+        cached = self._conditional.get(to_date)
+        if cached is not None:
+            etag, last_modified, _ = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        session = await self._get_session()
+        for attempt in range(self.retries + 1):
+            try:
+                async with session.get(request_url, headers=headers) as response:
+                    if response.status != 304:
+                        return await self._read_rates(response, to_date, retry=attempt < self.retries)
+                    if cached is not None:
+                        log.info("Exchange rates for %s not modified", to_date)
+                        return cached[2]
+                # Not modified, but nothing cached to reuse: fetch the full body instead.
+                log.warning("Got 304 for exchange rates of %s without a cached copy, fetching again", to_date)
+                async with session.get(request_url) as response:
+                    return await self._read_rates(response, to_date, retry=attempt < self.retries)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                if isinstance(exc, aiohttp.ClientResponseError) and exc.status not in RETRYABLE_STATUSES:
+                    raise
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * (2 ** attempt) * (1 + random.random())
+                log.warning(
+                    "National Bank request for %s failed (%s), retrying in %.1fs",
+                    to_date,
+                    exc,
+                    delay,
+                )
+                await asyncio.sleep(delay)
 
-        response = requests.get(request_url)
-        if response.status_code == 200:
-            response_data = response.text
-            data = parse_national_bank_rate(response_data)
-            return data
-        else:
-            response.raise_for_status()
+    async def _read_rates(
+        self, response: aiohttp.ClientResponse, to_date: datetime.date, *, retry: bool
+    ) -> national_bank.NationalBankResponse:
+        if response.status in RETRYABLE_STATUSES and retry:
+            raise aiohttp.ClientResponseError(
+                response.request_info,
+                response.history,
+                status=response.status,
+                message=response.reason or "",
+            )
+        response.raise_for_status()
+        response_data = await response.text()
+        data = parse_national_bank_rate(response_data)
+        self._remember(
+            to_date,
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+            data,
+        )
+        return data
+
+    async def get_exchange_rates_range(
+        self,
+        start_date: datetime.date,
+        end_date: datetime.date,
+    ) -> dict[datetime.date, national_bank.NationalBankResponse]:
+        """Fetch every day in ``[start_date, end_date]`` concurrently, at most ``max_concurrency`` at a time."""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        days = [
+            start_date + datetime.timedelta(days=offset)
+            for offset in range((end_date - start_date).days + 1)
+        ]
+
+        async def _fetch(day: datetime.date) -> national_bank.NationalBankResponse:
+            async with semaphore:
+                return await self.get_exchange_rates(day)
+
+        responses = await asyncio.gather(*(_fetch(day) for day in days))
+        return dict(zip(days, responses))
 
     def convert_currency(self, amount, from_currency, to_currency):
         # Implementation to convert currency using fetched exchange rates
         pass
 
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency, ttl_dns_cache=300),
+            )
+        return self._session
+
+    def _remember(self, day, etag, last_modified, data) -> None:
+        if not etag and not last_modified:
+            return
+        self._conditional[day] = (etag, last_modified, data)
+        while len(self._conditional) > self.max_conditional_entries:
+            self._conditional.pop(next(iter(self._conditional)))
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
 
     def __init__(self, config):
         self.base_url = config.get("NATIONAL_BANK_API_URL", "https://nationalbank.kz/rss/get_rates.cfm")
+        self.timeout = float(config.get("NATIONAL_BANK_TIMEOUT", 10))
+        self.retries = int(config.get("NATIONAL_BANK_RETRIES", 3))
+        self.backoff = float(config.get("NATIONAL_BANK_RETRY_BACKOFF", 0.5))
+        self.max_concurrency = int(config.get("NATIONAL_BANK_MAX_CONCURRENCY", 4))
+        self.max_conditional_entries = 32
         self.exchange_rates = None  # Don't fetch on initialization to avoid delays
+        self._session: aiohttp.ClientSession | None = None
+        # ETag / Last-Modified and the parsed body per date, for conditional re-fetches.
+        self._conditional: dict[datetime.date, tuple[str | None, str | None, national_bank.NationalBankResponse]] = {}
 
 
 def parse_national_bank_rate(text: str) -> national_bank.NationalBankResponse:
     data = xmltodict.parse(text)
-    rate = data.get("rates", {}) 
+    rate = data.get("rates", {})
     currencies = [national_bank.NationalBankCurrency(full_name=currency.get("fullname", "").title(),
                                                       title=currency.get("title", ""),
                                                       description=currency.get("description", ""),
@@ -47,4 +152,4 @@ def parse_national_bank_rate(text: str) -> national_bank.NationalBankResponse:
         date=rate.get("date", ""),
         currencies=currencies
     )
-    return national_bank.NationalBankResponse(rate=rates)
\ No newline at end of file
+    return national_bank.NationalBankResponse(rate=rates)
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, ClassVar
+
+import aiohttp
+from pydantic import RootModel
+
+from src.client import streaming
+from src.reqresp import compact
+from src.reqresp import search as search_reqresp
+from src.telemetry import metrics
+
+
+log = logging.getLogger("uvicorn.error")
+
+
+def provider_setting(config, name: str, key: str, default):
+    """``PROVIDER_<NAME>_<KEY>`` if set, else the shared ``PROVIDER_<KEY>``, else ``default``."""
+    value = config.get(f"PROVIDER_{name.upper()}_{key}")
+    if value is None:
+        value = config.get(f"PROVIDER_{key}")
+    return default if value is None else type(default)(value)
+
+
+class ProviderClient:
+    """HTTP client for one ticket provider's ``POST /search`` API.
+
+    Subclasses only declare where the provider lives. Every provider gets its
+    own session with explicit connection pool settings, configurable per
+    provider through ``PROVIDER_<NAME>_*`` or for all of them through
+    ``PROVIDER_*`` (see ``.env.example``).
+    """
+
+    name: ClassVar[str]
+    base_url_key: ClassVar[str]
+    default_base_url: ClassVar[str]
+    response_model: ClassVar[type[RootModel]] = RootModel[list[search_reqresp.SearchResult]]
+
+    def __init__(self, config):
+        self.config = config
+        self._session = None
+
+    def _setting(self, key: str, default):
+        return provider_setting(self.config, self.name, key, default)
+
+    def _connector(self) -> aiohttp.TCPConnector:
+        return aiohttp.TCPConnector(
+            limit=self._setting("POOL_SIZE", 100),
+            limit_per_host=self._setting("POOL_SIZE_PER_HOST", 0),
+            keepalive_timeout=self._setting("KEEPALIVE_TIMEOUT", 30.0),
+            ttl_dns_cache=self._setting("DNS_CACHE_TTL", 300),
+            use_dns_cache=True,
+        )
+
+    async def _get_session(self):
+        if self._session is None or self._session.closed:
+            encodings = self._setting("ACCEPT_ENCODING", "gzip, deflate")
+            headers = {"Accept-Encoding": encodings} if encodings else {}
+            self._session = aiohttp.ClientSession(
+                base_url=self.config.get(self.base_url_key, self.default_base_url),
+                timeout=aiohttp.ClientTimeout(float(self.config.get("HTTP_TIMEOUT", 100))),
+                connector=self._connector(),
+                headers=headers,
+                auto_decompress=True,
+            )
+        return self._session
+
+    async def warm_up(self) -> None:
+        """Open ``PROVIDER_WARM_CONNECTIONS`` keep-alive connections so the first search skips connection setup."""
+        session = await self._get_session()
+
+        async def _connect() -> None:
+            async with session.head("/", allow_redirects=False):
+                pass
+
+        results = await asyncio.gather(
+            *(_connect() for _ in range(self._setting("WARM_CONNECTIONS", 2))),
+            return_exceptions=True,
+        )
+        failures = [result for result in results if isinstance(result, Exception)]
+        if failures:
+            log.warning("Could not pre-warm connections to provider %s: %s", self.name, failures[0])
+        else:
+            log.info("Pre-warmed %s connections to provider %s", len(results), self.name)
+
+    async def search(self, criteria: search_reqresp.SearchCriteria | None = None) -> RootModel:
+        return self.response_model(
+            root=[compact.offer_to_model(offer) async for offer in self.search_iter(criteria)]
+        )
+
+    async def search_iter(self, criteria: search_reqresp.SearchCriteria | None = None) -> AsyncIterator[compact.CompactOffer]:
+        """Yield offers one by one while the response body is still arriving."""
+        session = await self._get_session()
+        payload = criteria.model_dump(mode="json") if criteria is not None else None
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            async with session.post("/search", json=payload) as response:
+                async for item in streaming.iter_search_results(response, provider=self.name):
+                    yield item
+            outcome = "ok"
+        except (GeneratorExit, asyncio.CancelledError):
+            outcome = "cancelled"
+            raise
+        finally:
+            metrics.PROVIDER_REQUEST_SECONDS.labels(self.name, outcome).observe(time.perf_counter() - started)
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
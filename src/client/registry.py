@@ -0,0 +1,43 @@
+"""Ticket providers enabled through ``SEARCH_PROVIDERS``.
+
+Entries are comma-separated and are either the name of a built-in provider
+or ``name=package.module:ClassName`` for any ``ProviderClient`` subclass.
+"""
+import importlib
+
+from src.client.provider import ProviderClient
+
+
+BUILTIN_PROVIDERS = {
+    "alpha": "src.client.alpha.client:AlphaClient",
+    "betta": "src.client.betta.client:BettaClient",
+}
+DEFAULT_PROVIDERS = "alpha,betta"
+
+
+def provider_class(path: str) -> type[ProviderClient]:
+    module_name, _, class_name = path.partition(":")
+    cls = getattr(importlib.import_module(module_name), class_name, None)
+    if not (isinstance(cls, type) and issubclass(cls, ProviderClient)):
+        raise ValueError(f"{path} is not a ProviderClient")
+    return cls
+
+
+def configured_providers(config) -> dict[str, type[ProviderClient]]:
+    providers = {}
+    for entry in config.get("SEARCH_PROVIDERS", DEFAULT_PROVIDERS).split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, path = entry.partition("=")
+        name = name.strip()
+        path = path.strip() or BUILTIN_PROVIDERS.get(name)
+        if path is None:
+            raise ValueError(f"Unknown search provider: {name}")
+        providers[name] = provider_class(path)
+    return providers
+
+
+def create_providers(config) -> dict[str, ProviderClient]:
+    """One client per configured provider, keyed by provider name."""
+    return {name: cls(config) for name, cls in configured_providers(config).items()}
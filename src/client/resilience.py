@@ -0,0 +1,261 @@
+"""Timeouts, hedged requests and circuit breaking for provider searches.
+
+``ResilientProviderClient`` wraps a provider so that:
+
+* a search that takes much longer than the provider usually needs is abandoned
+  (the limit follows a latency percentile of recent searches);
+* a request whose first offer is late compared to recent searches can be
+  duplicated, keeping whichever copy answers first;
+* a provider that keeps failing or timing out is skipped for a while and then
+  probed with a single search before it is used again.
+"""
+import asyncio
+import collections
+import contextlib
+import logging
+import time
+from typing import AsyncIterable, AsyncIterator, Optional, TypeVar
+
+from src.client.provider import provider_setting
+from src.reqresp import compact
+from src.reqresp import search as search_reqresp
+
+
+log = logging.getLogger("uvicorn.error")
+
+T = TypeVar("T")
+
+
+class ProviderUnavailable(Exception):
+    """The provider's circuit breaker is open."""
+
+
+class ProviderTimeout(TimeoutError):
+    """The provider did not finish within its timeout."""
+
+
+async def iter_until(iterable: AsyncIterable[T], deadline: float) -> AsyncIterator[T]:
+    """Iterate until loop time ``deadline``, then raise ``TimeoutError``.
+
+    Only the waits for the next item are interrupted, never the caller's own
+    work between items, so it is safe to write results while iterating.
+    """
+    iterator = aiter(iterable)
+    try:
+        while True:
+            timeout = asyncio.timeout_at(deadline)
+            try:
+                async with timeout:
+                    item = await anext(iterator)
+            except StopAsyncIteration:
+                return
+            except TimeoutError:
+                if timeout.expired():
+                    raise TimeoutError("deadline passed") from None
+                raise
+            yield item
+    finally:
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
+
+
+class LatencyWindow:
+    """Latencies of the most recent calls, for percentile estimates."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20) -> None:
+        self._samples: collections.deque[float] = collections.deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Latency below which ``fraction`` of the samples fall; None until there are enough samples."""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures and lets one probe through every ``reset_timeout`` seconds."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, name: str, *, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            log.info("Probing provider %s after its circuit breaker opened", self.name)
+            self.state = self.HALF_OPEN
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            log.info("Circuit breaker for provider %s closed", self.name)
+        self.state = self.CLOSED
+        self._failures = 0
+
+    def record_abandoned(self) -> None:
+        """A call was cancelled or closed before it had an outcome; let the next call probe instead."""
+        if self.state == self.HALF_OPEN:
+            self.state = self.OPEN
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                log.warning("Circuit breaker for provider %s opened after %s failures", self.name, self._failures)
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+
+class ResilientProviderClient:
+    """Applies adaptive timeouts, hedging and a circuit breaker to a provider's streamed searches."""
+
+    def __init__(
+        self,
+        name: str,
+        client,
+        *,
+        breaker: Optional[CircuitBreaker] = None,
+        min_timeout: float = 5.0,
+        max_timeout: float = 100.0,
+        timeout_percentile: float = 0.99,
+        timeout_multiplier: float = 2.0,
+        hedge_percentile: Optional[float] = None,
+        min_hedge_delay: float = 0.1,
+    ) -> None:
+        self.name = name
+        self.client = client
+        self.breaker = breaker or CircuitBreaker(name)
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_percentile = timeout_percentile
+        self.timeout_multiplier = timeout_multiplier
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.latency = LatencyWindow()
+        self.first_offer_latency = LatencyWindow()
+
+    @classmethod
+    def from_config(cls, name: str, client, config) -> "ResilientProviderClient":
+        hedge_percentile = provider_setting(config, name, "HEDGE_PERCENTILE", "")
+        return cls(
+            name,
+            client,
+            breaker=CircuitBreaker(
+                name,
+                failure_threshold=provider_setting(config, name, "BREAKER_FAILURES", 5),
+                reset_timeout=provider_setting(config, name, "BREAKER_RESET", 30.0),
+            ),
+            min_timeout=provider_setting(config, name, "TIMEOUT_MIN", 5.0),
+            max_timeout=provider_setting(config, name, "TIMEOUT_MAX", float(config.get("HTTP_TIMEOUT", 100))),
+            timeout_percentile=provider_setting(config, name, "TIMEOUT_PERCENTILE", 0.99),
+            timeout_multiplier=provider_setting(config, name, "TIMEOUT_MULTIPLIER", 2.0),
+            hedge_percentile=float(hedge_percentile) if hedge_percentile else None,
+            min_hedge_delay=provider_setting(config, name, "HEDGE_MIN_DELAY", 0.1),
+        )
+
+    def timeout(self) -> float:
+        """``timeout_multiplier`` times the latency percentile of recent searches, within the configured bounds."""
+        observed = self.latency.percentile(self.timeout_percentile)
+        if observed is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, observed * self.timeout_multiplier))
+
+    def hedge_delay(self) -> Optional[float]:
+        if self.hedge_percentile is None:
+            return None
+        observed = self.first_offer_latency.percentile(self.hedge_percentile)
+        return None if observed is None else max(self.min_hedge_delay, observed)
+
+    async def search(self, criteria: search_reqresp.SearchCriteria | None = None) -> list[compact.CompactOffer]:
+        return [offer async for offer in self.search_iter(criteria)]
+
+    async def search_iter(
+        self, criteria: search_reqresp.SearchCriteria | None = None
+    ) -> AsyncIterator[compact.CompactOffer]:
+        if not self.breaker.allow():
+            raise ProviderUnavailable(f"Provider {self.name} is temporarily disabled after repeated failures")
+
+        loop = asyncio.get_running_loop()
+        timeout = self.timeout()
+        started = loop.time()
+        deadline = started + timeout
+        try:
+            try:
+                iterator, first, exhausted = await asyncio.wait_for(self._race(criteria), timeout)
+                self.first_offer_latency.add(loop.time() - started)
+                if not exhausted:
+                    yield first
+                    async for offer in iter_until(iterator, deadline):
+                        yield offer
+            except TimeoutError as exc:
+                # Count the timeout as a sample, so a provider that became slower raises its own timeout.
+                self.latency.add(loop.time() - started)
+                raise ProviderTimeout(f"Provider {self.name} did not finish within {timeout:.1f}s") from exc
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled, or closed by a consumer that stopped reading: not the provider's fault.
+            self.breaker.record_abandoned()
+            raise
+        self.latency.add(loop.time() - started)
+        self.breaker.record_success()
+
+    async def _race(self, criteria) -> tuple[AsyncIterator[compact.CompactOffer], Optional[compact.CompactOffer], bool]:
+        """Start the search and wait for its first offer, hedging with a second request if it is late.
+
+        Returns the winning stream, its first offer and whether it was already exhausted.
+        """
+        primary = self.client.search_iter(criteria)
+        contenders = {asyncio.ensure_future(anext(primary)): primary}
+        try:
+            hedge_delay = self.hedge_delay()
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait(contenders, timeout=hedge_delay)
+                if not done:
+                    log.info("Hedging search to provider %s after %.2fs without offers", self.name, hedge_delay)
+                    secondary = self.client.search_iter(criteria)
+                    contenders[asyncio.ensure_future(anext(secondary))] = secondary
+
+            while True:
+                done, _ = await asyncio.wait(contenders, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    iterator = contenders.pop(task)
+                    exc = task.exception()
+                    if exc is None:
+                        return iterator, task.result(), False
+                    if isinstance(exc, StopAsyncIteration):
+                        return iterator, None, True
+                    await iterator.aclose()
+                    if not contenders:
+                        raise exc
+        finally:
+            for task, iterator in contenders.items():
+                task.cancel()
+                with contextlib.suppress(BaseException):
+                    await task
+                await iterator.aclose()
+
+    async def warm_up(self) -> None:
+        await self.client.warm_up()
+
+    async def close(self) -> None:
+        await self.client.close()
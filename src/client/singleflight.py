@@ -0,0 +1,212 @@
+import asyncio
+import contextlib
+import logging
+import time
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
+from uuid import uuid4
+
+import redis.asyncio as redis
+
+from src.reqresp import compact
+from src.reqresp import search as search_reqresp
+
+
+log = logging.getLogger("uvicorn.error")
+
+T = TypeVar("T")
+
+SINGLEFLIGHT_PREFIX = "singleflight"
+
+# Delete the lock only if it is still held by the caller's token.
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """Coalesces concurrent identical calls in this process and, through Redis, across processes.
+
+    Within a process all callers of the same key await one shared task, which
+    is cancelled once every caller has gone. Across processes the first caller
+    takes a Redis lock and publishes the encoded result under a short-lived key
+    that other processes poll for.
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        *,
+        lock_ttl_ms: int = 120_000,
+        result_ttl_ms: int = 5_000,
+        poll_interval: float = 0.1,
+        prefix: str = SINGLEFLIGHT_PREFIX,
+    ) -> None:
+        self.redis_client = redis_client
+        self.lock_ttl_ms = lock_ttl_ms
+        self.result_ttl_ms = result_ttl_ms
+        self.poll_interval = poll_interval
+        self.prefix = prefix
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._waiters: dict[asyncio.Task, int] = {}
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[T]],
+        encode: Callable[[T], str],
+        decode: Callable[[str], T],
+    ) -> T:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._do_shared(key, fn, encode, decode))
+            self._inflight[key] = task
+            task.add_done_callback(lambda finished: self._forget(key, finished))
+        else:
+            log.debug("Joining in-flight call for %s", key)
+
+        # Shield so a cancelled caller does not cancel the call for everyone else,
+        # but stop the call once no caller is left to take its result.
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            remaining = self._waiters[task] - 1
+            if remaining:
+                self._waiters[task] = remaining
+            else:
+                del self._waiters[task]
+                if not task.done():
+                    log.debug("Every caller of %s went away, cancelling the shared call", key)
+                    # Forget it now so a new caller does not join a call being cancelled.
+                    if self._inflight.get(key) is task:
+                        del self._inflight[key]
+                    task.cancel()
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # Mark as retrieved even if every caller went away.
+
+    async def _do_shared(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[T]],
+        encode: Callable[[T], str],
+        decode: Callable[[str], T],
+    ) -> T:
+        lock_key = f"{self.prefix}:{key}:lock"
+        result_key = f"{self.prefix}:{key}:result"
+
+        cached = await self.redis_client.get(result_key)
+        if cached is not None:
+            return decode(cached)
+
+        token = uuid4().hex
+        if await self.redis_client.set(lock_key, token, nx=True, px=self.lock_ttl_ms):
+            try:
+                value = await fn()
+                await self.redis_client.set(result_key, encode(value), px=self.result_ttl_ms)
+                return value
+            finally:
+                await self.redis_client.eval(_RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+
+        log.debug("Waiting for another process to finish %s", key)
+        deadline = time.monotonic() + self.lock_ttl_ms / 1000
+        while time.monotonic() < deadline:
+            cached = await self.redis_client.get(result_key)
+            if cached is not None:
+                return decode(cached)
+            if not await self.redis_client.exists(lock_key):
+                break
+            await asyncio.sleep(self.poll_interval)
+
+        cached = await self.redis_client.get(result_key)
+        if cached is not None:
+            return decode(cached)
+
+        # The owner failed or timed out without publishing; make the call ourselves.
+        log.info("Single-flight owner for %s gave no result, calling upstream directly", key)
+        return await fn()
+
+
+class SingleFlightClient:
+    """Provider client wrapper that shares identical concurrent searches."""
+
+    def __init__(self, name: str, client, flight: SingleFlight) -> None:
+        self.name = name
+        self.client = client
+        self.flight = flight
+
+    def _key(self, criteria: search_reqresp.SearchCriteria | None) -> str:
+        return f"{self.name}:search:{search_reqresp.criteria_cache_key(criteria)}"
+
+    async def search(self, criteria: search_reqresp.SearchCriteria | None = None) -> list[compact.CompactOffer]:
+        async def _fetch() -> list[compact.CompactOffer]:
+            return [offer async for offer in self.client.search_iter(criteria)]
+
+        return await self.flight.do(
+            self._key(criteria),
+            _fetch,
+            encode=compact.encode_offers,
+            decode=compact.decode_offers,
+        )
+
+    async def search_iter(
+        self,
+        criteria: search_reqresp.SearchCriteria | None = None,
+    ) -> AsyncIterator[compact.CompactOffer]:
+        """Stream offers when this caller owns the flight; joiners get the shared result at the end."""
+        received: asyncio.Queue = asyncio.Queue()
+        owner = False
+
+        async def _fetch() -> list[compact.CompactOffer]:
+            nonlocal owner
+            owner = True
+            offers = []
+            async for offer in self.client.search_iter(criteria):
+                offers.append(offer)
+                received.put_nowait(offer)
+            return offers
+
+        flight = asyncio.ensure_future(
+            self.flight.do(
+                self._key(criteria),
+                _fetch,
+                encode=compact.encode_offers,
+                decode=compact.decode_offers,
+            )
+        )
+        getter = None
+        try:
+            while not flight.done():
+                getter = asyncio.ensure_future(received.get())
+                await asyncio.wait({getter, flight}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                else:
+                    getter.cancel()
+
+            while not received.empty():
+                yield received.get_nowait()
+
+            offers = flight.result()
+            if not owner:
+                for offer in offers:
+                    yield offer
+        finally:
+            # Wait for the teardown so the shared call sees this caller leave.
+            for task in (getter, flight):
+                if task is not None and not task.done():
+                    task.cancel()
+                    with contextlib.suppress(BaseException):
+                        await task
+
+    async def warm_up(self) -> None:
+        await self.client.warm_up()
+
+    async def close(self) -> None:
+        await self.client.close()
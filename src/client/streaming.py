@@ -0,0 +1,108 @@
+import codecs
+import json
+import re
+import time
+from typing import Any, AsyncIterator
+
+import aiohttp
+
+from src.reqresp import compact
+from src.telemetry import metrics
+from src.telemetry import tracing
+
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r"\s*")
+
+# What JsonArrayStream expects next.
+_OPEN, _FIRST, _VALUE, _SEPARATOR, _CLOSED = range(5)
+
+
+class JsonArrayStream:
+    """Incrementally splits a top-level JSON array into its elements as bytes arrive.
+
+    Only the text of the element currently being received is buffered, so
+    memory stays bounded by the largest element rather than the whole body.
+    Elements must be separated by exactly one comma, and nothing but
+    whitespace may follow the closing bracket.
+    """
+
+    def __init__(self) -> None:
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._state = _OPEN
+
+    def feed(self, chunk: bytes) -> list[Any]:
+        buffer = self._buffer + self._text.decode(chunk)
+        items = []
+        pos = 0
+        while True:
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos >= len(buffer):
+                break
+            char = buffer[pos]
+            if self._state == _CLOSED:
+                raise ValueError(f"Unexpected {char!r} after the JSON array")
+            if self._state == _OPEN:
+                if char != "[":
+                    raise ValueError(f"Expected a JSON array, got {char!r}")
+                self._state = _FIRST
+                pos += 1
+                continue
+            if self._state == _SEPARATOR:
+                if char not in ",]":
+                    raise ValueError(f"Expected ',' or ']' after an array element, got {char!r}")
+                self._state = _VALUE if char == "," else _CLOSED
+                pos += 1
+                continue
+            if char == "]" and self._state == _FIRST:
+                self._state = _CLOSED
+                pos += 1
+                continue
+            if char in ",]":
+                raise ValueError(f"Expected an array element, got {char!r}")
+            try:
+                item, end = self._decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                break  # Element is incomplete; wait for more bytes.
+            if end == len(buffer) and isinstance(item, (int, float)):
+                break  # A number cut at the chunk boundary may still continue.
+            items.append(item)
+            self._state = _SEPARATOR
+            pos = end
+
+        self._buffer = buffer[pos:]
+        return items
+
+    def close(self) -> None:
+        self._buffer += self._text.decode(b"", final=True)
+        if self._state != _CLOSED:
+            raise ValueError("Truncated JSON array in provider response")
+
+
+async def iter_search_results(
+    response: aiohttp.ClientResponse,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+    provider: str = "",
+) -> AsyncIterator[compact.CompactOffer]:
+    """Decode and yield each offer of a provider response as soon as it has been received.
+
+    The time spent decoding, excluding waits for the network, is recorded per ``provider``.
+    """
+    response.raise_for_status()
+    trace = tracing.current()
+    received = trace.now()
+    stream = JsonArrayStream()
+    decoder = compact.OfferDecoder()
+    decoding = 0.0
+    async for chunk in response.content.iter_chunked(chunk_size):
+        started = time.perf_counter()
+        offers = [decoder.offer(raw) for raw in stream.feed(chunk)]
+        decoding += time.perf_counter() - started
+        for offer in offers:
+            yield offer
+    stream.close()
+    metrics.PROVIDER_DECODE_SECONDS.labels(provider).observe(decoding)
+    trace.add(f"decode.{provider}", received, trace.now(), cpu_ms=round(decoding * 1000, 1))
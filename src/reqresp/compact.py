@@ -0,0 +1,279 @@
+"""Compact in-memory representation of search offers for the worker and storage hot path.
+
+Provider offers are decoded straight from JSON into slotted dataclasses that
+share repeated strings (airline and airport codes, equipment names,
+timestamps), instead of a tree of pydantic models per offer. They are turned
+into the public ``SearchResult`` models only at the API edge.
+"""
+import datetime
+import json
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Optional
+
+from src.reqresp import search as search_reqresp
+
+
+@dataclass(slots=True)
+class CompactSegment:
+    operating_airline: str
+    marketing_airline: str
+    flight_number: str
+    equipment: Optional[str]
+    dep_at: str
+    dep_airport: str
+    arr_at: str
+    arr_airport: str
+    baggage: Optional[str]
+
+
+@dataclass(slots=True)
+class CompactFlight:
+    duration: int
+    segments: tuple[CompactSegment, ...]
+
+
+@dataclass(slots=True)
+class CompactOffer:
+    flights: tuple[CompactFlight, ...]
+    refundable: bool
+    validating_airline: str
+    total: float
+    base: float
+    taxes: float
+    currency: str
+    # Providers selling this itinerary, filled in when offers are merged.
+    providers: tuple[str, ...] = ()
+
+
+class OfferDecoder:
+    """Builds CompactOffers from provider JSON objects.
+
+    Equal strings decoded by one decoder share a single object, and each
+    distinct timestamp is validated once. Use one decoder per provider
+    response so the shared tables are freed with it.
+    """
+
+    def __init__(self) -> None:
+        self._strings: dict[str, str] = {}
+        self._times: dict[str, str] = {}
+
+    def _str(self, value: Any) -> str:
+        if not isinstance(value, str):
+            raise ValueError(f"Expected a string, got {value!r}")
+        return self._strings.setdefault(value, value)
+
+    def _opt_str(self, value: Any) -> Optional[str]:
+        return None if value is None else self._str(value)
+
+    def _time(self, value: Any) -> str:
+        normalized = self._times.get(value)
+        if normalized is None:
+            # Same text pydantic produces when dumping the datetime back to JSON.
+            normalized = self._str(datetime.datetime.fromisoformat(value).isoformat())
+            self._times[value] = normalized
+        return normalized
+
+    def segment(self, raw: dict) -> CompactSegment:
+        dep, arr = raw["dep"], raw["arr"]
+        return CompactSegment(
+            operating_airline=self._str(raw["operating_airline"]),
+            marketing_airline=self._str(raw["marketing_airline"]),
+            flight_number=self._str(raw["flight_number"]),
+            equipment=self._opt_str(raw.get("equipment")),
+            dep_at=self._time(dep["at"]),
+            dep_airport=self._str(dep["airport"]),
+            arr_at=self._time(arr["at"]),
+            arr_airport=self._str(arr["airport"]),
+            baggage=self._opt_str(raw.get("baggage")),
+        )
+
+    def offer(self, raw: dict) -> CompactOffer:
+        """Decode one provider offer, raising ``ValueError`` if it is malformed."""
+        try:
+            pricing = raw["pricing"]
+            refundable = raw["refundable"]
+            if not isinstance(refundable, bool):
+                raise ValueError(f"Expected a boolean, got {refundable!r}")
+            return CompactOffer(
+                flights=tuple(
+                    CompactFlight(
+                        duration=int(flight["duration"]),
+                        segments=tuple(self.segment(segment) for segment in flight["segments"]),
+                    )
+                    for flight in raw["flights"]
+                ),
+                refundable=refundable,
+                validating_airline=self._str(raw["validating_airline"]),
+                total=float(pricing["total"]),
+                base=float(pricing["base"]),
+                taxes=float(pricing["taxes"]),
+                currency=self._str(pricing["currency"]),
+                providers=tuple(self._str(provider) for provider in raw.get("providers") or ()),
+            )
+        except (KeyError, TypeError) as exc:
+            raise ValueError(f"Malformed provider offer: {exc!r}") from exc
+
+    def from_row(self, row: list) -> CompactOffer:
+        """Rebuild an offer from ``offer_to_row`` output; rows are trusted, so nothing is re-validated."""
+        flights, refundable, validating_airline, total, base, taxes, currency, *rest = row
+        providers = rest[0] if rest else ()  # Rows stored before offers were merged.
+        return CompactOffer(
+            flights=tuple(
+                CompactFlight(
+                    duration=duration,
+                    segments=tuple(
+                        CompactSegment(*(None if value is None else self._strings.setdefault(value, value)
+                                         for value in segment))
+                        for segment in segments
+                    ),
+                )
+                for duration, segments in flights
+            ),
+            refundable=refundable,
+            validating_airline=self._strings.setdefault(validating_airline, validating_airline),
+            total=total,
+            base=base,
+            taxes=taxes,
+            currency=self._strings.setdefault(currency, currency),
+            providers=tuple(self._strings.setdefault(provider, provider) for provider in providers),
+        )
+
+
+def offer_to_row(offer: CompactOffer) -> list:
+    """Positional form of an offer, without field names, for compact storage."""
+    return [
+        [
+            [
+                flight.duration,
+                [
+                    [
+                        segment.operating_airline,
+                        segment.marketing_airline,
+                        segment.flight_number,
+                        segment.equipment,
+                        segment.dep_at,
+                        segment.dep_airport,
+                        segment.arr_at,
+                        segment.arr_airport,
+                        segment.baggage,
+                    ]
+                    for segment in flight.segments
+                ],
+            ]
+            for flight in offer.flights
+        ],
+        offer.refundable,
+        offer.validating_airline,
+        offer.total,
+        offer.base,
+        offer.taxes,
+        offer.currency,
+        list(offer.providers),
+    ]
+
+
+def offer_to_dict(offer: CompactOffer) -> dict:
+    """JSON-ready dict with the same shape as ``SearchResult.model_dump(mode="json")``."""
+    document = {
+        "flights": [
+            {
+                "duration": flight.duration,
+                "segments": [
+                    {
+                        "operating_airline": segment.operating_airline,
+                        "marketing_airline": segment.marketing_airline,
+                        "flight_number": segment.flight_number,
+                        "equipment": segment.equipment,
+                        "dep": {"at": segment.dep_at, "airport": segment.dep_airport},
+                        "arr": {"at": segment.arr_at, "airport": segment.arr_airport},
+                        "baggage": segment.baggage,
+                    }
+                    for segment in flight.segments
+                ],
+            }
+            for flight in offer.flights
+        ],
+        "refundable": offer.refundable,
+        "validating_airline": offer.validating_airline,
+        "pricing": {
+            "total": offer.total,
+            "base": offer.base,
+            "taxes": offer.taxes,
+            "currency": offer.currency,
+        },
+    }
+    if offer.providers:
+        document["providers"] = list(offer.providers)
+    return document
+
+
+def offer_from_model(model: search_reqresp.SearchResult, decoder: Optional[OfferDecoder] = None) -> CompactOffer:
+    return (decoder or OfferDecoder()).offer(model.model_dump(mode="json"))
+
+
+def offer_to_model(offer: CompactOffer) -> search_reqresp.SearchResult:
+    return search_reqresp.SearchResult.model_validate(offer_to_dict(offer))
+
+
+def encode_offers(offers: Iterable[CompactOffer]) -> str:
+    return json.dumps([offer_to_dict(offer) for offer in offers], separators=(",", ":"))
+
+
+def decode_offers(payload: str) -> list[CompactOffer]:
+    decoder = OfferDecoder()
+    return [decoder.offer(raw) for raw in json.loads(payload)]
+
+
+@dataclass(slots=True)
+class CompactSearch:
+    """Worker-side state of one search; serializes to the stored ``SearchResponse`` document."""
+
+    search_id: str
+    status: search_reqresp.SearchStatus = search_reqresp.SearchStatus.PENDING
+    message: Optional[str] = None
+    items: list[CompactOffer] = field(default_factory=list)
+    providers: dict[str, search_reqresp.SearchStatus] = field(default_factory=dict)
+    created_at: Optional[datetime.datetime] = None
+    # Storage bookkeeping: (item count, encoded bytes) of every chunk already written,
+    # and positions of written items that were replaced since.
+    chunks: list[tuple[int, int]] = field(default_factory=list)
+    replaced: set[int] = field(default_factory=set)
+
+    @property
+    def persisted(self) -> int:
+        """Number of items already written by the result store."""
+        return sum(count for count, _ in self.chunks)
+
+    @property
+    def encoded_bytes(self) -> int:
+        return sum(size for _, size in self.chunks)
+
+    def to_document(self) -> dict:
+        """Same JSON shape as ``SearchResponse.model_dump(mode="json")``."""
+        document: dict[str, Any] = {"search_id": self.search_id, "status": self.status.value}
+        if self.message:
+            document["message"] = self.message
+        if self.items:
+            document["items"] = [offer_to_dict(offer) for offer in self.items]
+        if self.created_at is not None:
+            document["created_at"] = self.created_at.isoformat().replace("+00:00", "Z")
+        if self.providers:
+            document["providers"] = {name: status.value for name, status in self.providers.items()}
+        return document
+
+    @classmethod
+    def from_document(cls, document: dict) -> "CompactSearch":
+        """Inverse of ``to_document``."""
+        decoder = OfferDecoder()
+        created_at = document.get("created_at")
+        return cls(
+            search_id=document["search_id"],
+            status=search_reqresp.SearchStatus(document["status"]),
+            message=document.get("message"),
+            items=[decoder.offer(item) for item in document.get("items") or []],
+            providers={
+                name: search_reqresp.SearchStatus(status)
+                for name, status in (document.get("providers") or {}).items()
+            },
+            created_at=datetime.datetime.fromisoformat(created_at) if created_at else None,
+        )
@@ -0,0 +1,44 @@
+import sys
+from array import array
+from dataclasses import dataclass
+from typing import Iterable, Mapping, Optional, Protocol, Sequence
+
+
+class CrossRates(Protocol):
+    def factor(self, source: str, target: str) -> Optional[float]:
+        ...
+
+
+@dataclass(frozen=True, slots=True)
+class PriceColumn:
+    """Totals and currencies of a search's offers, converted to a currency in one pass."""
+
+    totals: array
+    currencies: tuple[str, ...]
+
+    def __len__(self) -> int:
+        return len(self.totals)
+
+    @classmethod
+    def from_offers(cls, offers: Iterable) -> "PriceColumn":
+        totals = array("d")
+        currencies = []
+        for offer in offers:
+            totals.append(offer.total)
+            currencies.append(sys.intern(offer.currency.upper()))
+        return cls(totals=totals, currencies=tuple(currencies))
+
+    def convert(self, rates: CrossRates, target: str) -> Optional[tuple[float, ...]]:
+        """Convert every total to ``target`` in one pass; None if a source currency is unknown."""
+        factors: Mapping[str, Optional[float]] = {
+            code: rates.factor(code, target) for code in set(self.currencies)
+        }
+        if None in factors.values():
+            return None
+        return tuple(
+            round(total * factor, 2)
+            for total, factor in zip(self.totals, map(factors.__getitem__, self.currencies))
+        )
+
+    def unsupported(self, rates: CrossRates, target: str) -> Sequence[str]:
+        return sorted(code for code in set(self.currencies) if rates.factor(code, target) is None)
@@ -1,19 +1,69 @@
 import enum
-from typing import Optional, List
+import hashlib
+from typing import Dict, Optional, List
 from uuid import UUID
-from datetime import datetime
+from datetime import date, datetime
 import uuid
-from pydantic import BaseModel, Field, RootModel
+from pydantic import BaseModel, Field, RootModel, field_validator, model_validator
 
 
 class SearchStatus(str, enum.Enum):
     PENDING = "pending"
+    PARTIAL = "partial"
     COMPLETED = "completed"
     ERROR = "error"
 
 
+class Passengers(BaseModel):
+    adults: int = Field(1, ge=1, le=9, description="Number of adult passengers")
+    children: int = Field(0, ge=0, le=9, description="Number of child passengers")
+    infants: int = Field(0, ge=0, le=9, description="Number of infant passengers")
+
+
+class SearchCriteria(BaseModel):
+    origin: str = Field(..., min_length=3, max_length=3, description="Origin airport code")
+    destination: str = Field(..., min_length=3, max_length=3, description="Destination airport code")
+    departure_date: date = Field(..., description="Outbound departure date")
+    return_date: Optional[date] = Field(None, description="Return departure date for round trips")
+    passengers: Passengers = Field(default_factory=Passengers, description="Passenger counts")
+
+    @field_validator("origin", "destination", mode="before")
+    @classmethod
+    def normalize_airport(cls, value):
+        return value.strip().upper() if isinstance(value, str) else value
+
+    @model_validator(mode="after")
+    def check_dates(self):
+        if self.return_date is not None and self.return_date < self.departure_date:
+            raise ValueError("return_date must not be before departure_date")
+        return self
+
+    def cache_key(self) -> str:
+        """Stable hash of the normalized query; equal searches share provider calls and cache entries."""
+        return hashlib.sha1(self.model_dump_json().encode()).hexdigest()
+
+
+def criteria_cache_key(criteria: Optional[SearchCriteria]) -> str:
+    return criteria.cache_key() if criteria is not None else "any"
+
+
 class RedisSearchRequest(BaseModel):
     search_id: str = Field(..., description="Unique identifier for the search request")
+    criteria: Optional[SearchCriteria] = Field(None, description="Search criteria passed to the providers")
+
+    @field_validator("criteria", mode="before")
+    @classmethod
+    def parse_criteria(cls, value):
+        # Stream entries are flat string maps, so criteria travel as a JSON string.
+        if isinstance(value, str):
+            return SearchCriteria.model_validate_json(value) if value else None
+        return value
+
+    def to_stream_fields(self) -> dict[str, str]:
+        fields = {"search_id": self.search_id}
+        if self.criteria is not None:
+            fields["criteria"] = self.criteria.model_dump_json()
+        return fields
 
 
 class SearchResponse(BaseModel):
@@ -21,6 +71,10 @@ class SearchResponse(BaseModel):
     status: SearchStatus = Field(SearchStatus.PENDING, description="Status of the search operation")
     message: Optional[str] = Field(default=None, description="Additional message or details", exclude_if=lambda value: value is None or value == "")
     items: Optional[List["SearchResult"]] = Field(default_factory=list, description="List of search result items", exclude_if=lambda value: value is None or len(value) == 0)
+    created_at: Optional[datetime] = Field(default=None, description="When the search request was enqueued", exclude_if=lambda value: value is None)
+    providers: Optional[Dict[str, SearchStatus]] = Field(default_factory=dict, description="Status of the search per provider", exclude_if=lambda value: value is None or len(value) == 0)
+    total: Optional[int] = Field(default=None, description="Number of items matching the filters, for paginated requests", exclude_if=lambda value: value is None)
+    next_cursor: Optional[str] = Field(default=None, description="Cursor of the next page, if there is one", exclude_if=lambda value: value is None)
 
 
 class RedisSearchResponse(RootModel[List[SearchResponse]]):
@@ -71,6 +125,7 @@ class SearchResult(BaseModel):
     validating_airline: str = Field(..., description="Validating airline code")
     pricing: Pricing = Field(..., description="Pricing information")
     price: Optional[Price] = Field(None, description="Price information", exclude_if=lambda value: value is None)
+    providers: Optional[List[str]] = Field(None, description="Providers offering this itinerary", exclude_if=lambda value: not value)
 
 
 class AlphaSearchResponse(RootModel[List[SearchResult]]):
@@ -0,0 +1,260 @@
+"""Sort and filter indexes over the offers of completed searches.
+
+When a search completes, its offers are indexed once: a sorted set of item
+positions per sort key (price in KZT, total duration, first departure) and a
+bitmap of item positions per filter value (validating airline, number of
+stops, refundable). A page of results then costs a few small reads and only
+the offers on that page are loaded, however many the search holds.
+"""
+import datetime
+from dataclasses import dataclass
+from typing import Callable, Optional, Sequence
+
+import redis.asyncio as redis
+
+from src.reqresp import compact
+from src.reqresp.price_column import CrossRates, PriceColumn
+
+
+SEARCH_INDEX_PREFIX = "search_index"
+SORT_KEYS = ("price", "duration", "departure")
+INDEX_CURRENCY = "KZT"
+# Sorted set members fetched per round-trip while looking for offers that pass the filters.
+SCAN_BATCH = 64
+
+# Delete the filter bitmaps listed in the meta hash of a previous build.
+_DELETE_BITMAPS_SCRIPT = """
+local bitmaps = redis.call("hget", KEYS[1], "bitmaps")
+if bitmaps then
+    for key in string.gmatch(bitmaps, "[^,]+") do
+        redis.call("del", key)
+    end
+end
+return 0
+"""
+
+
+def offer_duration(offer: compact.CompactOffer) -> int:
+    return sum(flight.duration for flight in offer.flights)
+
+
+def offer_departure(offer: compact.CompactOffer) -> float:
+    if not offer.flights or not offer.flights[0].segments:
+        return 0.0
+    return datetime.datetime.fromisoformat(offer.flights[0].segments[0].dep_at).timestamp()
+
+
+def offer_stops(offer: compact.CompactOffer) -> int:
+    """Stops on the flight with the most of them; 0 for a non-stop itinerary."""
+    return max((len(flight.segments) - 1 for flight in offer.flights), default=0)
+
+
+@dataclass(frozen=True, slots=True)
+class ResultQuery:
+    """Sort order, filters and page of a results request. ``offset`` is a position in the sort order."""
+
+    sort: Optional[str] = None
+    airlines: tuple[str, ...] = ()
+    max_stops: Optional[int] = None
+    refundable: Optional[bool] = None
+    offset: int = 0
+    limit: Optional[int] = None
+
+    @property
+    def filtered(self) -> bool:
+        return bool(self.airlines) or self.max_stops is not None or self.refundable is not None
+
+    def matches(self, offer: compact.CompactOffer) -> bool:
+        if self.airlines and offer.validating_airline.upper() not in self.airlines:
+            return False
+        if self.max_stops is not None and offer_stops(offer) > self.max_stops:
+            return False
+        if self.refundable is not None and offer.refundable != self.refundable:
+            return False
+        return True
+
+    def apply(
+        self,
+        offers: Sequence[compact.CompactOffer],
+        prices: Optional[Sequence[float]] = None,
+    ) -> "ResultPage":
+        """Evaluate the query in memory, for searches without indexes. ``prices`` are needed to sort by price."""
+        positions = range(len(offers))
+        if self.sort == "price":
+            order = sorted(positions, key=prices.__getitem__)
+        elif self.sort == "duration":
+            order = sorted(positions, key=lambda position: offer_duration(offers[position]))
+        elif self.sort == "departure":
+            order = sorted(positions, key=lambda position: offer_departure(offers[position]))
+        else:
+            order = list(positions)
+
+        matching = [
+            (rank, position) for rank, position in enumerate(order) if self.matches(offers[position])
+        ]
+        page = [(rank, position) for rank, position in matching if rank >= self.offset]
+        return ResultPage.from_ranked(page, len(matching), self.limit)
+
+
+@dataclass(frozen=True, slots=True)
+class ResultPage:
+    """Item positions of one page, the number of offers matching the filters and where the next page starts."""
+
+    positions: list[int]
+    total: int
+    next_offset: Optional[int]
+
+    @classmethod
+    def from_ranked(cls, ranked: Sequence[tuple[int, int]], total: int, limit: Optional[int]) -> "ResultPage":
+        """Page from ``(rank, position)`` pairs in order; more than ``limit`` pairs means another page follows."""
+        if limit is None or len(ranked) <= limit:
+            return cls(positions=[position for _, position in ranked], total=total, next_offset=None)
+        return cls(
+            positions=[position for _, position in ranked[:limit]],
+            total=total,
+            next_offset=ranked[limit][0],
+        )
+
+
+class ResultIndex:
+    """Builds the indexes of a search inside the result store's final write and answers queries from them."""
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        rates: Optional[Callable[[], Optional[CrossRates]]] = None,
+    ) -> None:
+        self.redis_client = redis_client
+        self.rates = rates
+
+    @staticmethod
+    def key(search_id: str, *parts: object) -> str:
+        return ":".join((SEARCH_INDEX_PREFIX, search_id, *map(str, parts)))
+
+    def queue_build(
+        self,
+        pipe: redis.client.Pipeline,
+        search_id: str,
+        offers: Sequence[compact.CompactOffer],
+        ttl: int,
+    ) -> None:
+        keys = []
+        sort_scores = {
+            "duration": [offer_duration(offer) for offer in offers],
+            "departure": [offer_departure(offer) for offer in offers],
+        }
+        table = self.rates() if self.rates is not None else None
+        prices = PriceColumn.from_offers(offers).convert(table, INDEX_CURRENCY) if table is not None else None
+        if prices is not None:
+            sort_scores["price"] = prices
+
+        # A rebuild replaces every index of the previous build, including values no longer present.
+        meta_key = self.key(search_id)
+        pipe.eval(_DELETE_BITMAPS_SCRIPT, 1, meta_key)
+        pipe.delete(meta_key, *(self.key(search_id, "sort", sort) for sort in SORT_KEYS))
+
+        # Zero-padded members so that ties (ordered by member) keep provider order.
+        digits = len(str(max(len(offers) - 1, 0)))
+        for sort, scores in sort_scores.items():
+            if offers:
+                key = self.key(search_id, "sort", sort)
+                pipe.zadd(key, {str(position).zfill(digits): score for position, score in enumerate(scores)})
+                keys.append(key)
+
+        width = (len(offers) + 7) // 8
+        bitmaps: dict[str, bytearray] = {}
+        for position, offer in enumerate(offers):
+            for field, value in (
+                ("airline", offer.validating_airline.upper()),
+                ("stops", offer_stops(offer)),
+                ("refundable", int(offer.refundable)),
+            ):
+                bitmap = bitmaps.setdefault(self.key(search_id, field, value), bytearray(width))
+                # Same bit order as SETBIT: item 0 is the highest bit of the first byte.
+                bitmap[position >> 3] |= 0x80 >> (position & 7)
+        for key, bitmap in bitmaps.items():
+            pipe.set(key, bytes(bitmap), ex=ttl)
+
+        pipe.hset(
+            meta_key,
+            mapping={
+                "count": len(offers),
+                "sorts": ",".join(sort_scores),
+                "stops": ",".join(sorted({str(offer_stops(offer)) for offer in offers})),
+                "bitmaps": ",".join(bitmaps),
+            },
+        )
+        keys.append(meta_key)
+        for key in keys:
+            pipe.expire(key, ttl)
+
+    async def query(self, search_id: str, query: ResultQuery) -> Optional[ResultPage]:
+        """Answer ``query`` from the indexes, or None if the search has none for it."""
+        meta = await self.redis_client.hgetall(self.key(search_id))
+        if not meta or (query.sort is not None and query.sort not in meta["sorts"].split(",")):
+            return None
+
+        count = int(meta["count"])
+        mask = await self._filter_mask(search_id, query, meta, count) if query.filtered else None
+        total = count if mask is None else mask.bit_count()
+        wanted = None if query.limit is None else query.limit + 1
+
+        if query.sort is None:
+            ranks = range(query.offset, count)
+            if mask is not None:
+                ranks = (rank for rank in ranks if _bit(mask, rank, count))
+            ranked = []
+            for rank in ranks:
+                ranked.append((rank, rank))
+                if wanted is not None and len(ranked) == wanted:
+                    break
+            return ResultPage.from_ranked(ranked, total, query.limit)
+
+        key = self.key(search_id, "sort", query.sort)
+        ranked = []
+        start = query.offset
+        while start < count and (wanted is None or len(ranked) < wanted):
+            batch = SCAN_BATCH if mask is not None or wanted is None else max(wanted, 1)
+            members = await self.redis_client.zrange(key, start, start + batch - 1)
+            if not members:
+                break
+            for rank, member in enumerate(members, start):
+                position = int(member)
+                if mask is None or _bit(mask, position, count):
+                    ranked.append((rank, position))
+                    if wanted is not None and len(ranked) == wanted:
+                        break
+            start += len(members)
+        return ResultPage.from_ranked(ranked, total, query.limit)
+
+    async def _filter_mask(self, search_id: str, query: ResultQuery, meta: dict, count: int) -> int:
+        """Bitmap of the offers passing every filter, as an int with item 0 in the highest bit."""
+        groups: list[list[str]] = []
+        if query.airlines:
+            groups.append([self.key(search_id, "airline", airline) for airline in query.airlines])
+        if query.max_stops is not None:
+            stops = [int(value) for value in meta["stops"].split(",") if value]
+            groups.append([self.key(search_id, "stops", value) for value in stops if value <= query.max_stops])
+        if query.refundable is not None:
+            groups.append([self.key(search_id, "refundable", int(query.refundable))])
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        for group in groups:
+            for key in group:
+                pipe.execute_command("GET", key, NEVER_DECODE=True)
+        bitmaps = iter(await pipe.execute())
+
+        width = (count + 7) // 8
+        mask = (1 << width * 8) - 1
+        for group in groups:
+            union = 0
+            for _ in group:
+                data = next(bitmaps)
+                if data:
+                    union |= int.from_bytes(data[:width].ljust(width, b"\0"), "big")
+            mask &= union
+        return mask
+
+
+def _bit(mask: int, position: int, count: int) -> bool:
+    return bool(mask >> (((count + 7) // 8) * 8 - 1 - position) & 1)
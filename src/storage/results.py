@@ -0,0 +1,376 @@
+"""Storage of search results in Redis.
+
+``JsonResultStore`` keeps each search as one RedisJSON document that is
+rewritten on every flush. ``BinaryResultStore`` keeps the search status in a
+small hash and appends the offers to a list as compact, optionally
+compressed chunks, so a flush only writes the offers it has not written yet.
+"""
+import abc
+import bisect
+import datetime
+import itertools
+import json
+import logging
+import zlib
+from typing import Any, Callable, NamedTuple, Optional, Sequence
+
+import redis.asyncio as redis
+
+from src.reqresp import compact
+from src.reqresp import search as search_reqresp
+from src.reqresp.price_column import CrossRates
+from src.storage.index import ResultIndex
+
+
+log = logging.getLogger("uvicorn.error")
+
+
+SEARCH_RESULTS_PREFIX = "search_results"
+SEARCH_EVENTS_PREFIX = "search_events"
+
+
+def events_channel(search_id: str) -> str:
+    """Pub/sub channel announcing every write of a search."""
+    return f"{SEARCH_EVENTS_PREFIX}:{search_id}"
+
+
+class StreamAck(NamedTuple):
+    """Stream entry to acknowledge in the same transaction as a result write."""
+
+    stream: str
+    group: str
+    message_id: str
+
+
+class RowCodec:
+    """Encodes chunks of offers as JSON arrays of positional rows, optionally zlib-compressed."""
+
+    def __init__(self, compression: Optional[str] = "zlib", level: int = 6) -> None:
+        if compression not in (None, "zlib"):
+            raise ValueError(f"Unsupported search results compression: {compression}")
+        self.compression = compression
+        self.level = level
+
+    @property
+    def name(self) -> str:
+        return f"rows+{self.compression}" if self.compression else "rows"
+
+    def encode(self, offers: Sequence[compact.CompactOffer]) -> bytes:
+        data = json.dumps([compact.offer_to_row(offer) for offer in offers], separators=(",", ":")).encode()
+        return zlib.compress(data, self.level) if self.compression else data
+
+    def decode(self, data: bytes, decoder: compact.OfferDecoder) -> list[compact.CompactOffer]:
+        if self.compression:
+            data = zlib.decompress(data)
+        return [decoder.from_row(row) for row in json.loads(data)]
+
+
+def get_codec(name: str) -> RowCodec:
+    """Codec for a ``RowCodec.name``, as recorded with each stored search."""
+    if name == "rows":
+        return RowCodec(compression=None)
+    if name.startswith("rows+"):
+        return RowCodec(compression=name.removeprefix("rows+"))
+    raise ValueError(f"Unknown search results format: {name}")
+
+
+class ResultStore(abc.ABC):
+    """Writes and reads the state of searches; ``write`` is called on every flush of a search.
+
+    Each write is one MULTI/EXEC round-trip that only sends the offers added
+    since the previous write, optionally acknowledging the stream entry the
+    search came from in the same transaction. It also publishes the new status,
+    item count and rewritten positions on the search's events channel.
+    """
+
+    def __init__(self, redis_client: redis.Redis, *, ttl: int = 3600, index: Optional[ResultIndex] = None) -> None:
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.index = index or ResultIndex(redis_client)
+
+    async def write(self, result: compact.CompactSearch, *, ack: Optional[StreamAck] = None) -> None:
+        pipe = self.redis_client.pipeline(transaction=True)
+        written = self._queue_write(pipe, result)
+        self._write_completed(pipe, result)
+        # Take the queued positions before awaiting: positions replaced again while the
+        # transaction is in flight land in the fresh set and are rewritten next time.
+        rewritten, result.replaced = result.replaced, set()
+        event = {
+            "status": result.status.value,
+            "providers": {name: status.value for name, status in result.providers.items()},
+            "items": sum(count for count, _ in written),
+            "replaced": sorted(position for position in rewritten if position < result.persisted),
+        }
+        pipe.publish(events_channel(result.search_id), json.dumps(event))
+        if ack is not None:
+            pipe.xack(ack.stream, ack.group, ack.message_id)
+        try:
+            await pipe.execute()
+        except BaseException:
+            result.replaced |= rewritten
+            raise
+        result.chunks = written
+
+    @abc.abstractmethod
+    def _queue_write(self, pipe: redis.client.Pipeline, result: compact.CompactSearch) -> list[tuple[int, int]]:
+        """Queue the commands storing ``result``; returns its chunk bookkeeping once they succeed.
+
+        Written items listed in ``result.replaced`` are rewritten in place.
+        """
+
+    @abc.abstractmethod
+    async def read(self, search_id: str, *, items: bool = True) -> Optional[compact.CompactSearch]:
+        """Stored state of a search; with ``items=False`` only its status fields are loaded."""
+
+    @abc.abstractmethod
+    async def read_items(self, search_id: str, positions: Sequence[int]) -> list[compact.CompactOffer]:
+        """The offers at ``positions``, in that order."""
+
+    @abc.abstractmethod
+    async def encoded_size(self, search_id: str) -> Optional[int]:
+        """Bytes the stored offers of a search take in Redis."""
+
+    @abc.abstractmethod
+    async def expires_in(self, search_id: str) -> Optional[float]:
+        """Seconds until the stored search expires; None if it has no expiry or is gone."""
+
+    def _write_completed(self, pipe: redis.client.Pipeline, result: compact.CompactSearch) -> None:
+        if result.status == search_reqresp.SearchStatus.COMPLETED:
+            self.index.queue_build(pipe, result.search_id, result.items, self.ttl)
+
+
+class JsonResultStore(ResultStore):
+    """The whole search as one RedisJSON document.
+
+    The first write creates the document; later ones update the status fields
+    and ``JSON.ARRAPPEND`` the new offers to ``$.items``.
+    """
+
+    def _queue_write(self, pipe: redis.client.Pipeline, result: compact.CompactSearch) -> list[tuple[int, int]]:
+        results_key = f"{SEARCH_RESULTS_PREFIX}:{result.search_id}"
+        unwritten = result.items[result.persisted:]
+        if not result.chunks:
+            document = result.to_document()
+            document["items"] = [compact.offer_to_dict(offer) for offer in unwritten]
+            payload = json.dumps(document, separators=(",", ":"))
+            pipe.execute_command("JSON.SET", results_key, "$", payload)
+            pipe.expire(results_key, self.ttl)
+            return [(len(unwritten), len(payload))]
+
+        pipe.execute_command("JSON.SET", results_key, "$.status", json.dumps(result.status.value))
+        pipe.execute_command(
+            "JSON.SET",
+            results_key,
+            "$.providers",
+            json.dumps({name: status.value for name, status in result.providers.items()}),
+        )
+        if result.message:
+            pipe.execute_command("JSON.SET", results_key, "$.message", json.dumps(result.message))
+        for position in sorted(result.replaced):
+            if position < result.persisted:
+                item = json.dumps(compact.offer_to_dict(result.items[position]), separators=(",", ":"))
+                pipe.execute_command("JSON.SET", results_key, f"$.items[{position}]", item)
+        if not unwritten:
+            return result.chunks
+        items = [json.dumps(compact.offer_to_dict(offer), separators=(",", ":")) for offer in unwritten]
+        pipe.execute_command("JSON.ARRAPPEND", results_key, "$.items", *items)
+        return result.chunks + [(len(unwritten), sum(map(len, items)))]
+
+    async def read(self, search_id: str, *, items: bool = True) -> Optional[compact.CompactSearch]:
+        paths = ("$",) if items else ("$.search_id", "$.status", "$.message", "$.providers", "$.created_at")
+        cached = await self.redis_client.json().get(f"{SEARCH_RESULTS_PREFIX}:{search_id}", *paths)
+        if not cached:
+            return None
+        if items:
+            return compact.CompactSearch.from_document(cached[0] if isinstance(cached, list) else cached)
+        return compact.CompactSearch.from_document(
+            {path.removeprefix("$."): values[0] for path, values in cached.items() if values}
+        )
+
+    async def read_items(self, search_id: str, positions: Sequence[int]) -> list[compact.CompactOffer]:
+        if not positions:
+            return []
+        paths = [f"$.items[{position}]" for position in positions]
+        cached = await self.redis_client.json().get(f"{SEARCH_RESULTS_PREFIX}:{search_id}", *paths)
+        if len(paths) == 1:
+            cached = {paths[0]: cached}
+        decoder = compact.OfferDecoder()
+        return [decoder.offer(cached[path][0]) for path in paths if cached.get(path)]
+
+    async def encoded_size(self, search_id: str) -> Optional[int]:
+        size = await self.redis_client.execute_command(
+            "JSON.DEBUG", "MEMORY", f"{SEARCH_RESULTS_PREFIX}:{search_id}"
+        )
+        return size or None
+
+    async def expires_in(self, search_id: str) -> Optional[float]:
+        return await _seconds_to_expiry(self.redis_client, f"{SEARCH_RESULTS_PREFIX}:{search_id}")
+
+
+class BinaryResultStore(ResultStore):
+    """Search status in a hash plus an append-only list of encoded offer chunks.
+
+    ``search_results:{id}:meta`` holds the status fields, the codec name and
+    the item count of every chunk; ``search_results:{id}:chunks`` holds the
+    chunks of at most ``chunk_size`` offers each. Both are written in the
+    same transaction and the list is only appended to, so a reader that loads the
+    metadata first finds at least the chunks it describes.
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        *,
+        ttl: int = 3600,
+        index: Optional[ResultIndex] = None,
+        codec: Optional[RowCodec] = None,
+        chunk_size: int = 16,
+    ) -> None:
+        super().__init__(redis_client, ttl=ttl, index=index)
+        self.codec = codec or RowCodec()
+        self.chunk_size = max(1, chunk_size)
+
+    @staticmethod
+    def meta_key(search_id: str) -> str:
+        return f"{SEARCH_RESULTS_PREFIX}:{search_id}:meta"
+
+    @staticmethod
+    def chunks_key(search_id: str) -> str:
+        return f"{SEARCH_RESULTS_PREFIX}:{search_id}:chunks"
+
+    def _queue_write(self, pipe: redis.client.Pipeline, result: compact.CompactSearch) -> list[tuple[int, int]]:
+        unwritten = result.items[result.persisted:]
+        chunks = []
+        for start in range(0, len(unwritten), self.chunk_size):
+            batch = unwritten[start:start + self.chunk_size]
+            chunks.append((len(batch), self.codec.encode(batch)))
+        written = list(result.chunks)
+        meta_key, chunks_key = self.meta_key(result.search_id), self.chunks_key(result.search_id)
+
+        if result.replaced:
+            starts = list(itertools.accumulate((count for count, _ in result.chunks), initial=0))
+            for chunk in sorted({bisect.bisect_right(starts, position) - 1 for position in result.replaced}):
+                if chunk >= len(result.chunks):
+                    continue  # Not written yet.
+                data = self.codec.encode(result.items[starts[chunk]:starts[chunk + 1]])
+                pipe.lset(chunks_key, chunk, data)
+                written[chunk] = (written[chunk][0], len(data))
+        written += [(count, len(data)) for count, data in chunks]
+
+        if not result.chunks:
+            # A redelivered search starts over; drop chunks left by the earlier attempt.
+            pipe.delete(chunks_key)
+        pipe.hset(meta_key, mapping=self._meta(result, written))
+        pipe.expire(meta_key, self.ttl)
+        if chunks:
+            pipe.rpush(chunks_key, *(data for _, data in chunks))
+            pipe.expire(chunks_key, self.ttl)
+        return written
+
+    def _meta(self, result: compact.CompactSearch, written: list[tuple[int, int]]) -> dict[str, Any]:
+        return {
+            "status": result.status.value,
+            "message": result.message or "",
+            "providers": json.dumps({name: status.value for name, status in result.providers.items()}),
+            "created_at": result.created_at.isoformat() if result.created_at else "",
+            "format": self.codec.name,
+            "chunks": ",".join(str(count) for count, _ in written),
+            "encoded_bytes": sum(size for _, size in written),
+        }
+
+    async def read(self, search_id: str, *, items: bool = True) -> Optional[compact.CompactSearch]:
+        # Not a transaction: EXEC replies would be decoded as text. Ordering is enough, see above.
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.hgetall(self.meta_key(search_id))
+        if items:
+            pipe.execute_command("LRANGE", self.chunks_key(search_id), 0, -1, NEVER_DECODE=True)
+        meta, *chunks = await pipe.execute()
+        if not meta:
+            return None
+
+        offers = []
+        if items:
+            codec = get_codec(meta["format"])
+            decoder = compact.OfferDecoder()
+            described = len(_chunk_counts(meta))
+            offers = [offer for chunk in chunks[0][:described] for offer in codec.decode(chunk, decoder)]
+        return compact.CompactSearch(
+            search_id=search_id,
+            status=search_reqresp.SearchStatus(meta["status"]),
+            message=meta["message"] or None,
+            items=offers,
+            providers={
+                name: search_reqresp.SearchStatus(status)
+                for name, status in json.loads(meta["providers"]).items()
+            },
+            created_at=datetime.datetime.fromisoformat(meta["created_at"]) if meta["created_at"] else None,
+        )
+
+    async def read_items(self, search_id: str, positions: Sequence[int]) -> list[compact.CompactOffer]:
+        if not positions:
+            return []
+        meta = await self.redis_client.hmget(self.meta_key(search_id), "format", "chunks")
+        if meta[0] is None:
+            return []
+        codec = get_codec(meta[0])
+        starts = list(itertools.accumulate(_chunk_counts({"chunks": meta[1]}), initial=0))
+
+        located = []
+        for position in positions:
+            chunk = bisect.bisect_right(starts, position) - 1
+            if 0 <= chunk < len(starts) - 1:
+                located.append((chunk, position - starts[chunk]))
+        needed = sorted({chunk for chunk, _ in located})
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        for chunk in needed:
+            pipe.execute_command("LINDEX", self.chunks_key(search_id), chunk, NEVER_DECODE=True)
+        decoder = compact.OfferDecoder()
+        decoded = {
+            chunk: codec.decode(data, decoder)
+            for chunk, data in zip(needed, await pipe.execute())
+            if data is not None
+        }
+        return [decoded[chunk][offset] for chunk, offset in located if chunk in decoded]
+
+    async def encoded_size(self, search_id: str) -> Optional[int]:
+        size = await self.redis_client.hget(self.meta_key(search_id), "encoded_bytes")
+        return None if size is None else int(size)
+
+    async def expires_in(self, search_id: str) -> Optional[float]:
+        return await _seconds_to_expiry(self.redis_client, self.meta_key(search_id))
+
+
+async def _seconds_to_expiry(redis_client: redis.Redis, key: str) -> Optional[float]:
+    pttl = await redis_client.pttl(key)
+    return pttl / 1000 if pttl > 0 else None
+
+
+def _chunk_counts(meta: dict) -> list[int]:
+    return [int(count) for count in meta["chunks"].split(",")] if meta["chunks"] else []
+
+
+def create_result_store(
+    redis_client: redis.Redis,
+    config: dict[str, str],
+    rates: Optional[Callable[[], Optional[CrossRates]]] = None,
+) -> ResultStore:
+    """Result store selected by ``SEARCH_RESULTS_FORMAT`` (``binary`` or ``json``).
+
+    ``rates`` returns the current exchange rates, used to index completed searches by price.
+    """
+    ttl = int(config.get("SEARCH_RESULTS_TTL", 3600))
+    index = ResultIndex(redis_client, rates)
+    result_format = config.get("SEARCH_RESULTS_FORMAT", "binary")
+    if result_format == "json":
+        return JsonResultStore(redis_client, ttl=ttl, index=index)
+    if result_format == "binary":
+        compression = config.get("SEARCH_RESULTS_COMPRESSION", "zlib")
+        return BinaryResultStore(
+            redis_client,
+            ttl=ttl,
+            index=index,
+            codec=RowCodec(compression=None if compression == "none" else compression),
+            chunk_size=int(config.get("SEARCH_RESULTS_CHUNK_SIZE", 16)),
+        )
+    raise ValueError(f"Unknown SEARCH_RESULTS_FORMAT: {result_format}")
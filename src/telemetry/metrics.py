@@ -0,0 +1,187 @@
+"""Process-local metrics rendered in the Prometheus text exposition format.
+
+Recording a value is a dict lookup, a bisect and a few additions, cheap enough
+for every request, provider call and Redis command. Each process keeps its
+own values; scrape every API and worker process separately.
+"""
+import bisect
+import math
+import time
+from typing import Iterable, Optional, Sequence
+
+import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SIZE_BUCKETS = tuple(float(4 ** exponent) for exponent in range(5, 13))  # 1 KiB .. 16 MiB
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple[float, ...]) -> None:
+        self._bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self._bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.bounds = tuple(sorted(buckets))
+        self._children: dict[tuple[str, ...], _HistogramChild] = {}
+
+    def labels(self, *values: str) -> _HistogramChild:
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            child = self._children.setdefault(values, _HistogramChild(self.bounds))
+        return child
+
+    def observe(self, value: float, *labels: str) -> None:
+        self.labels(*labels).observe(value)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip((*self.bounds, math.inf), child.counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Gauge:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} gauge"
+        for values, value in list(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: list[Histogram | Gauge] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "".join(f"{line}\n" for metric in self._metrics for line in metric.render())
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "http_request_duration_seconds",
+    "Time to serve an API request, by route template and status code.",
+    ("method", "route", "status"),
+))
+PROVIDER_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "provider_request_duration_seconds",
+    "Time from sending a provider search to its last offer, by outcome.",
+    ("provider", "outcome"),
+))
+PROVIDER_DECODE_SECONDS = REGISTRY.register(Histogram(
+    "provider_decode_duration_seconds",
+    "Time spent parsing and validating one provider response.",
+    ("provider",),
+))
+REDIS_COMMAND_SECONDS = REGISTRY.register(Histogram(
+    "redis_command_duration_seconds",
+    "Round trip of a Redis command or pipeline, including blocking reads.",
+    ("command",),
+))
+SEARCH_COMPLETION_SECONDS = REGISTRY.register(Histogram(
+    "search_completion_seconds",
+    "Time from enqueueing a search to storing its final result.",
+    ("status",),
+))
+SEARCH_RESULT_BYTES = REGISTRY.register(Histogram(
+    "search_result_bytes",
+    "Encoded size of completed search results.",
+    buckets=SIZE_BUCKETS,
+))
+SEARCH_STREAM_LENGTH = REGISTRY.register(Gauge(
+    "search_stream_length",
+    "Entries in the search request stream.",
+))
+SEARCH_CONSUMER_LAG = REGISTRY.register(Gauge(
+    "search_consumer_lag",
+    "Search requests not yet read by any consumer.",
+))
+SEARCH_PENDING = REGISTRY.register(Gauge(
+    "search_pending",
+    "Search requests read by a consumer but not yet acknowledged.",
+))
+
+
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            REDIS_COMMAND_SECONDS.labels("MULTI" if self.is_transaction else "PIPELINE").observe(
+                time.perf_counter() - started
+            )
+
+
+class InstrumentedRedis(redis.Redis):
+    """Redis client recording the duration of every command and pipeline it sends."""
+
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            REDIS_COMMAND_SECONDS.labels(str(args[0]).upper()).observe(time.perf_counter() - started)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> Pipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
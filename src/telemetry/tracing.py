@@ -0,0 +1,159 @@
+"""Per-search span timelines.
+
+The worker opens a ``SearchTrace`` for each sampled search and makes it the
+current trace of the handling task, so code further down (provider clients,
+decoders) can add spans without it being passed around. Unsampled searches
+get ``NULL_TRACE``, whose methods do nothing.
+
+Spans are kept as ``[name, start_ms, duration_ms, attrs]`` rows, with times
+relative to when the search was enqueued, and stored as one small JSON value
+expiring with the search results.
+"""
+import contextlib
+import contextvars
+import cProfile
+import datetime
+import json
+import logging
+import os
+import time
+from typing import Any, Iterator, Optional
+
+import redis.asyncio as redis
+
+
+log = logging.getLogger("uvicorn.error")
+
+
+SEARCH_TRACE_PREFIX = "search_trace"
+
+
+class SearchTrace:
+    def __init__(self, search_id: str, enqueued_at: datetime.datetime) -> None:
+        self.search_id = search_id
+        self.enqueued_at = enqueued_at
+        # Monotonic clock for durations, anchored to the wall clock of the enqueue time.
+        self._offset = time.time() - enqueued_at.timestamp() - time.perf_counter()
+        self.spans: list[list[Any]] = []
+
+    def now(self) -> float:
+        """Seconds since the search was enqueued."""
+        return time.perf_counter() + self._offset
+
+    def add(self, name: str, start: float, end: float, **attrs: Any) -> None:
+        """Record a span between two ``now()`` readings."""
+        row: list[Any] = [name, round(start * 1000, 1), round((end - start) * 1000, 1)]
+        if attrs:
+            row.append(attrs)
+        self.spans.append(row)
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[dict]:
+        """Time the block; attributes can still be added to the yielded dict inside it."""
+        start = self.now()
+        try:
+            yield attrs
+        finally:
+            self.add(name, start, self.now(), **attrs)
+
+    def to_document(self) -> dict:
+        return {
+            "search_id": self.search_id,
+            "enqueued_at": self.enqueued_at.isoformat().replace("+00:00", "Z"),
+            "spans": self.spans,
+        }
+
+
+class _NullTrace:
+    """Stand-in for unsampled searches."""
+
+    search_id = None
+
+    def now(self) -> float:
+        return 0.0
+
+    def add(self, name: str, start: float, end: float, **attrs: Any) -> None:
+        pass
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[dict]:
+        yield attrs
+
+
+NULL_TRACE = _NullTrace()
+
+_current: contextvars.ContextVar[SearchTrace | _NullTrace] = contextvars.ContextVar(
+    "search_trace", default=NULL_TRACE
+)
+
+
+def current() -> SearchTrace | _NullTrace:
+    """Trace of the search handled by the running task."""
+    return _current.get()
+
+
+@contextlib.contextmanager
+def activate(trace: SearchTrace | _NullTrace) -> Iterator[SearchTrace | _NullTrace]:
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+def expand_spans(document: dict) -> dict:
+    """Stored trace with each span row turned into a named-field object."""
+    spans = []
+    for name, start_ms, duration_ms, *rest in document["spans"]:
+        spans.append({"name": name, "start_ms": start_ms, "duration_ms": duration_ms, **(rest[0] if rest else {})})
+    spans.sort(key=lambda span: span["start_ms"])
+    return {**document, "spans": spans}
+
+
+class TraceStore:
+    def __init__(self, redis_client: redis.Redis, *, ttl: int = 3600) -> None:
+        self.redis_client = redis_client
+        self.ttl = ttl
+
+    async def save(self, trace: SearchTrace) -> None:
+        await self.redis_client.set(
+            f"{SEARCH_TRACE_PREFIX}:{trace.search_id}",
+            json.dumps(trace.to_document(), separators=(",", ":")),
+            ex=self.ttl,
+        )
+
+    async def load(self, search_id: str) -> Optional[dict]:
+        raw = await self.redis_client.get(f"{SEARCH_TRACE_PREFIX}:{search_id}")
+        return None if raw is None else json.loads(raw)
+
+
+_profiling = False
+
+
+@contextlib.contextmanager
+def profiled(directory: str, name: str) -> Iterator[None]:
+    """Profile the block with cProfile and write ``<directory>/<name>.prof``.
+
+    cProfile sees the whole thread, so the profile includes whatever other
+    tasks ran meanwhile. Only one block is profiled at a time; nested or
+    concurrent requests run unprofiled.
+    """
+    global _profiling
+    if _profiling:
+        yield
+        return
+
+    _profiling = True
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{name}.prof")
+        profiler.dump_stats(path)
+        log.info("Wrote profile %s", path)
+    finally:
+        _profiling = False
@@ -0,0 +1,54 @@
+"""Backfill the per-date exchange rate history from the National Bank.
+
+Usage::
+
+    python -m src.worker.backfill_rates --start 2026-01-01 [--end 2026-10-17]
+"""
+import argparse
+import asyncio
+import datetime
+import logging
+
+import redis.asyncio as redis
+
+from src.api import dependencies
+from src.api import rates as rates_cache
+from src.client.nationalbank.client import NationalBankClient
+
+
+log = logging.getLogger("uvicorn.error")
+
+
+async def backfill(start_date: datetime.date, end_date: datetime.date) -> int:
+    config = dependencies.get_config()
+    redis_client = redis.Redis.from_url(
+        config.get("REDIS_URL", "redis://localhost:6379/0"),
+        decode_responses=True,
+    )
+    nb_client = NationalBankClient(config)
+    try:
+        history = rates_cache.RateHistory(redis_client)
+        return await history.backfill(nb_client, start_date, end_date)
+    finally:
+        await nb_client.close()
+        await redis_client.aclose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--start", type=datetime.date.fromisoformat, required=True, help="First date, YYYY-MM-DD")
+    parser.add_argument(
+        "--end",
+        type=datetime.date.fromisoformat,
+        default=datetime.date.today(),
+        help="Last date, YYYY-MM-DD (default: today)",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    stored = asyncio.run(backfill(args.start, args.end))
+    log.info("Stored exchange rates for %s new dates between %s and %s", stored, args.start, args.end)
+
+
+if __name__ == "__main__":
+    main()
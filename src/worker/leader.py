@@ -0,0 +1,112 @@
+import asyncio
+import contextlib
+import functools
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+from uuid import uuid4
+
+import redis.asyncio as redis
+
+
+log = logging.getLogger("uvicorn.error")
+
+
+SCHEDULER_LEASE_KEY = "scheduler:leader"
+
+# Take the lease if it is free, or extend it if the caller's token already holds it.
+_ACQUIRE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+if redis.call("set", KEYS[1], ARGV[1], "NX", "PX", ARGV[2]) then
+    return 1
+end
+return 0
+"""
+
+# Delete the lease only if it is still held by the caller's token.
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class LeaderLease:
+    """Redis lease electing one process among all replicas to run scheduled jobs.
+
+    Every process keeps trying to take the lease, so when the leader dies
+    another one takes over within ``ttl_ms``. A process considers itself the
+    leader only until its last successful renewal would expire, minus the
+    renewal interval, so two processes never both believe they lead.
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        *,
+        key: str = SCHEDULER_LEASE_KEY,
+        ttl_ms: int = 30_000,
+        renew_interval: Optional[float] = None,
+    ) -> None:
+        self.redis_client = redis_client
+        self.key = key
+        self.ttl_ms = ttl_ms
+        self.renew_interval = renew_interval if renew_interval is not None else ttl_ms / 3000
+        self.token = uuid4().hex
+        self._valid_until = 0.0
+        self._task: asyncio.Task | None = None
+
+    @property
+    def is_leader(self) -> bool:
+        return time.monotonic() < self._valid_until
+
+    async def start(self) -> None:
+        await self._campaign()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+        if self.is_leader:
+            # Hand over right away instead of making the next leader wait for the lease to expire.
+            with contextlib.suppress(Exception):
+                await self.redis_client.eval(_RELEASE_SCRIPT, 1, self.key, self.token)
+            log.info("Released scheduler leadership")
+        self._valid_until = 0.0
+
+    def leader_only(self, job: Callable[..., Awaitable[None]]) -> Callable[..., Awaitable[None]]:
+        """Wrap a scheduled job so that it only runs in the leading process."""
+
+        @functools.wraps(job)
+        async def _job(*args, **kwargs) -> None:
+            if not self.is_leader:
+                log.debug("Skipping %s: not the scheduler leader", job.__name__)
+                return
+            await job(*args, **kwargs)
+
+        return _job
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            try:
+                await self._campaign()
+            except Exception as exc:  # pragma: no cover - defensive guardrail
+                log.warning("Could not renew scheduler lease: %s", exc)
+
+    async def _campaign(self) -> None:
+        was_leader = self.is_leader
+        started = time.monotonic()
+        held = await self.redis_client.eval(_ACQUIRE_SCRIPT, 1, self.key, self.token, self.ttl_ms)
+        if held:
+            self._valid_until = started + self.ttl_ms / 1000 - self.renew_interval
+            if not was_leader:
+                log.info("Became the scheduler leader")
+        elif was_leader:
+            self._valid_until = 0.0
+            log.warning("Lost scheduler leadership")
@@ -0,0 +1,69 @@
+import dataclasses
+from typing import Callable, Hashable, Optional
+
+from src.reqresp import compact
+from src.reqresp.price_column import CrossRates
+
+
+COMPARE_CURRENCY = "KZT"
+
+
+def itinerary_key(offer: compact.CompactOffer) -> Hashable:
+    """Identity of the itinerary an offer sells: every segment's flight number, airports and times."""
+    return tuple(
+        (
+            segment.marketing_airline,
+            segment.flight_number,
+            segment.dep_airport,
+            segment.dep_at,
+            segment.arr_airport,
+            segment.arr_at,
+        )
+        for flight in offer.flights
+        for segment in flight.segments
+    )
+
+
+class OfferMerger:
+    """Merges offers from all providers of one search, keeping the cheapest offer per itinerary.
+
+    The kept offer records every provider that sold the itinerary. Offers
+    replaced after they were written out are marked in ``result.replaced``
+    so the result store rewrites them.
+    """
+
+    def __init__(
+        self,
+        result: compact.CompactSearch,
+        rates: Optional[Callable[[], Optional[CrossRates]]] = None,
+    ) -> None:
+        self.result = result
+        self.rates = rates
+        self._positions: dict[Hashable, int] = {}
+
+    def add(self, offer: compact.CompactOffer, provider: str) -> None:
+        key = itinerary_key(offer)
+        position = self._positions.get(key)
+        if position is None:
+            self._positions[key] = len(self.result.items)
+            self.result.items.append(dataclasses.replace(offer, providers=(provider,)))
+            return
+
+        current = self.result.items[position]
+        providers = current.providers if provider in current.providers else (*current.providers, provider)
+        kept = offer if self._cheaper(offer, current) else current
+        # Offers may be shared with other searches through the provider cache, so never mutate them.
+        self.result.items[position] = dataclasses.replace(kept, providers=providers)
+        self.result.replaced.add(position)
+
+    def _cheaper(self, offer: compact.CompactOffer, current: compact.CompactOffer) -> bool:
+        if offer.currency.upper() == current.currency.upper():
+            return offer.total < current.total
+        table = self.rates() if self.rates is not None else None
+        if table is None:
+            return False
+        offer_factor = table.factor(offer.currency, COMPARE_CURRENCY)
+        current_factor = table.factor(current.currency, COMPARE_CURRENCY)
+        if offer_factor is None or current_factor is None:
+            return False
+        return offer.total * offer_factor < current.total * current_factor
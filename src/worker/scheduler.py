@@ -2,26 +2,49 @@ import logging
 
 import fastapi
 
-from src.api import dependencies
+from src.api import rates as rates_cache
 
 
 log = logging.getLogger("uvicorn.error")
 
+STARTUP_REFRESH_LOCK_KEY = "exchange_rates:startup_refresh"
+
 
 async def refresh_exchange_rates_job(app: fastapi.FastAPI):
     log.info("SCHEDULER: Running scheduled job to refresh exchange rates.")
 
     try:
-        config = dependencies.get_config()
-        nb_client = dependencies.get_national_bank_client(config)
-        log.info("SCHEDULER: National Bank Client initialized.")
-
-        rates = nb_client.get_exchange_rates()
-        rates_json = rates.model_dump_json()
+        nb_client = app.state.nb_client
+        rates = await nb_client.get_exchange_rates()
         log.info("SCHEDULER: Fetched exchange rates from National Bank.")
-        await app.state.redis.set("exchange_rates", rates_json)
-        log.info("SCHEDULER: Updated exchange rates in Redis.")
+        version = await rates_cache.store_exchange_rates(app.state.redis, rates)
+        log.info("SCHEDULER: Updated exchange rates in Redis (version %s).", version)
     except Exception as e:
         log.error(f"SCHEDULER: Job failed: {e}")
 
-    log.info("SCHEDULER: Job completed successfully.")
\ No newline at end of file
+    log.info("SCHEDULER: Job completed successfully.")
+
+
+async def ensure_fresh_exchange_rates(app: fastapi.FastAPI, max_age: float, lock_ttl_ms: int = 60_000) -> None:
+    """Fetch rates at startup unless they are younger than ``max_age`` seconds.
+
+    When several replicas start at once only the one taking the lock calls the
+    bank; the others receive the rates through the rates update channel.
+    """
+    age = await rates_cache.exchange_rates_age(app.state.redis)
+    if age is not None and age < max_age:
+        log.info("Exchange rates fetched %.0fs ago are fresh, skipping startup fetch.", age)
+        return
+    if not await app.state.redis.set(STARTUP_REFRESH_LOCK_KEY, "1", nx=True, px=lock_ttl_ms):
+        log.info("Another replica is fetching exchange rates, skipping startup fetch.")
+        return
+
+    try:
+        rates = await app.state.nb_client.get_exchange_rates()
+        log.info("Fetched initial exchange rates from National Bank.")
+        await rates_cache.store_exchange_rates(app.state.redis, rates)
+        log.info("Initial exchange rates stored in Redis.")
+    except Exception as e:
+        log.error(f"Error fetching initial exchange rates: {str(e)}")
+        # Let the next replica to start retry instead of waiting for the lock to expire.
+        await app.state.redis.delete(STARTUP_REFRESH_LOCK_KEY)
@@ -0,0 +1,246 @@
+"""Search consumer processes running outside the API.
+
+Usage::
+
+    python worker.py [--processes 4]
+
+Starts the given number of consumer processes (``SEARCH_WORKER_PROCESSES``,
+default one per CPU) and restarts any that die. On SIGTERM or SIGINT every
+process stops reading new searches and finishes the ones in flight before it
+exits; processes still busy after ``SEARCH_WORKER_DRAIN_TIMEOUT`` seconds (by
+default the search deadline plus a margin) are killed and their searches are
+reclaimed by the remaining consumers.
+
+Run the API with ``SEARCH_CONSUMER_ENABLED=false`` so searches are only
+handled here. With ``SEARCH_WORKER_METRICS_PORT`` set, process ``i`` serves its
+Prometheus metrics on ``/metrics`` at that port plus ``i``.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import time
+
+import redis.asyncio as redis
+from aiohttp import web
+
+from src.api import dependencies
+from src.api import rates as rates_cache
+from src.client import cache as provider_cache
+from src.client import registry as provider_registry
+from src.client import resilience
+from src.client import singleflight
+from src.storage import results as result_storage
+from src.telemetry import metrics
+from src.worker import worker
+
+
+log = logging.getLogger("uvicorn.error")
+
+RESTART_DELAY = 1.0
+# Seconds a search waits past the provider timeout before completing without the slow providers.
+SEARCH_DEADLINE_MARGIN = 20.0
+# Seconds a draining process gets past the search deadline to store and ack its last results.
+DRAIN_MARGIN = 15.0
+
+
+def create_search_clients(redis_client: redis.Redis, config) -> dict[str, provider_cache.CachedProviderClient]:
+    """Configured providers wrapped with timeouts, single-flight requests and the shared response cache."""
+    flight = singleflight.SingleFlight(
+        redis_client,
+        lock_ttl_ms=int(config.get("PROVIDER_SINGLEFLIGHT_LOCK_TTL_MS", 120_000)),
+        result_ttl_ms=int(config.get("PROVIDER_SINGLEFLIGHT_RESULT_TTL_MS", 5_000)),
+    )
+    cache_ttl = int(config.get("PROVIDER_CACHE_TTL", 300))
+    cache_stale_ttl = int(config.get("PROVIDER_CACHE_STALE_TTL", 600))
+    return {
+        name: provider_cache.CachedProviderClient(
+            name,
+            singleflight.SingleFlightClient(
+                name, resilience.ResilientProviderClient.from_config(name, client, config), flight
+            ),
+            redis_client,
+            ttl=cache_ttl,
+            stale_ttl=cache_stale_ttl,
+        )
+        for name, client in provider_registry.create_providers(config).items()
+    }
+
+
+def search_deadline(config) -> float:
+    """``SEARCH_DEADLINE``, by default a margin above the longest a provider request may take."""
+    if config.get("SEARCH_DEADLINE"):
+        return float(config["SEARCH_DEADLINE"])
+    provider_timeout = float(config.get("PROVIDER_TIMEOUT_MAX") or config.get("HTTP_TIMEOUT") or 100)
+    return provider_timeout + SEARCH_DEADLINE_MARGIN
+
+
+def drain_timeout(config) -> float:
+    """``SEARCH_WORKER_DRAIN_TIMEOUT``, by default long enough for a search started just before shutdown."""
+    if config.get("SEARCH_WORKER_DRAIN_TIMEOUT"):
+        return float(config["SEARCH_WORKER_DRAIN_TIMEOUT"])
+    return search_deadline(config) + DRAIN_MARGIN
+
+
+def create_consumer(
+    redis_client: redis.Redis,
+    config,
+    providers,
+    *,
+    result_store: result_storage.ResultStore,
+    rates: rates_cache.RateTableCache,
+) -> worker.SearchRequestConsumer:
+    return worker.SearchRequestConsumer(
+        redis_client,
+        providers,
+        result_store=result_store,
+        rates=rates.get,
+        concurrency=int(config.get("SEARCH_CONSUMER_CONCURRENCY", 8)),
+        batch_size=int(config.get("SEARCH_CONSUMER_BATCH_SIZE", 8)),
+        claim_idle_ms=int(config.get("SEARCH_CONSUMER_CLAIM_IDLE_MS", 300_000)),
+        flush_size=int(config.get("SEARCH_FLUSH_SIZE", 50)),
+        flush_interval=float(config.get("SEARCH_FLUSH_INTERVAL", 0.5)),
+        search_deadline=search_deadline(config),
+        trace_sample_rate=float(config.get("SEARCH_TRACE_SAMPLE_RATE", 1.0)),
+        profile_sample_rate=float(config.get("SEARCH_PROFILE_SAMPLE_RATE", 0.0)),
+        profile_dir=config.get("SEARCH_PROFILE_DIR", "profiles"),
+    )
+
+
+async def serve_metrics(port: int) -> web.AppRunner:
+    async def _metrics(request: web.Request) -> web.Response:
+        return web.Response(
+            body=metrics.REGISTRY.render().encode(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, port=port).start()
+    log.info("Serving worker metrics on port %s", port)
+    return runner
+
+
+async def run_consumer(metrics_port: int = 0) -> None:
+    """Run one consumer until SIGTERM or SIGINT, then drain its in-flight searches."""
+    config = dependencies.get_config()
+    redis_client = metrics.InstrumentedRedis.from_url(
+        config.get("REDIS_URL", "redis://localhost:6379/0"),
+        decode_responses=True,
+    )
+    rates = rates_cache.RateTableCache(
+        redis_client,
+        check_interval=float(config.get("EXCHANGE_RATES_CHECK_INTERVAL", 30)),
+    )
+    providers = create_search_clients(redis_client, config)
+    metrics_runner = None
+    try:
+        if metrics_port:
+            metrics_runner = await serve_metrics(metrics_port)
+        await rates.start()
+        await asyncio.gather(*(provider.warm_up() for provider in providers.values()))
+        consumer = create_consumer(
+            redis_client,
+            config,
+            providers,
+            result_store=result_storage.create_result_store(redis_client, config, rates=rates.get),
+            rates=rates,
+        )
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, consumer.stop)
+        await consumer.start()
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await rates.stop()
+        for provider in providers.values():
+            await provider.close()
+        await redis_client.aclose()
+
+
+def _consumer_process(metrics_port: int) -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(process)d %(levelname)s %(message)s")
+    asyncio.run(run_consumer(metrics_port))
+
+
+def supervise(processes: int, drain_timeout: float, metrics_port: int = 0) -> None:
+    """Keep ``processes`` consumer processes running until SIGTERM or SIGINT, then drain them."""
+    context = multiprocessing.get_context("spawn")
+    stopping = False
+
+    def _stop(signum, frame) -> None:
+        nonlocal stopping
+        if not stopping:
+            log.info("🛑 Received %s, draining %s search workers", signal.Signals(signum).name, processes)
+        stopping = True
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    def _spawn(index: int) -> multiprocessing.Process:
+        port = metrics_port + index if metrics_port else 0
+        process = context.Process(target=_consumer_process, args=(port,), name=f"search-worker-{index}")
+        process.start()
+        return process
+
+    children = [_spawn(index) for index in range(processes)]
+    log.info("🚀 Started %s search workers: %s", processes, ", ".join(str(child.pid) for child in children))
+
+    while not stopping:
+        time.sleep(RESTART_DELAY)
+        for index, child in enumerate(children):
+            if not child.is_alive() and not stopping:
+                log.error("Search worker %s exited with code %s, restarting it", child.pid, child.exitcode)
+                children[index] = _spawn(index)
+
+    for child in children:
+        if child.is_alive():
+            child.terminate()
+    deadline = time.monotonic() + drain_timeout
+    for child in children:
+        child.join(max(0.0, deadline - time.monotonic()))
+        if child.is_alive():
+            log.warning("Search worker %s did not drain in %ss, killing it", child.pid, drain_timeout)
+            child.kill()
+            child.join()
+    log.info("✅ All search workers stopped")
+
+
+def main() -> None:
+    config = dependencies.get_config()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=int(config.get("SEARCH_WORKER_PROCESSES") or 0) or os.cpu_count() or 1,
+        help="Consumer processes to run (default: SEARCH_WORKER_PROCESSES, else one per CPU)",
+    )
+    parser.add_argument(
+        "--drain-timeout",
+        type=float,
+        default=drain_timeout(config),
+        help="Seconds each process may take to finish its searches after SIGTERM "
+        "(default: SEARCH_WORKER_DRAIN_TIMEOUT, else the search deadline plus %ss)" % DRAIN_MARGIN,
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=int(config.get("SEARCH_WORKER_METRICS_PORT") or 0),
+        help="First port for per-process /metrics endpoints (default: SEARCH_WORKER_METRICS_PORT, 0 disables)",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(process)d %(levelname)s %(message)s")
+    if args.drain_timeout < search_deadline(config):
+        log.warning(
+            "Drain timeout %ss is shorter than the search deadline %ss; searches still running on shutdown "
+            "are only retried once their messages have been idle long enough to be claimed",
+            args.drain_timeout,
+            search_deadline(config),
+        )
+    supervise(max(1, args.processes), args.drain_timeout, args.metrics_port)
@@ -1,13 +1,24 @@
 import asyncio
+import datetime
 import logging
-from typing import Protocol, runtime_checkable
+import os
+import random
+import socket
+import time
+from typing import AsyncIterator, Callable, Mapping, Optional, Protocol, runtime_checkable
 
 import redis.asyncio as redis
+from pydantic import ValidationError
 from redis.exceptions import ResponseError
 
-from src.client.alpha.client import AlphaClient
-from src.client.betta.client import BettaClient
+from src.client import resilience
+from src.reqresp import compact
 from src.reqresp import search as search_reqresp
+from src.reqresp.price_column import CrossRates
+from src.storage import results as result_storage
+from src.telemetry import metrics
+from src.telemetry import tracing
+from src.worker import merge
 
 
 log = logging.getLogger("uvicorn.error")
@@ -27,40 +38,96 @@ class ConsumerProtocol(Protocol):
         ...
 
 
+def default_consumer_name() -> str:
+    """Consumer name unique to this process so pending entries can be attributed."""
+    return f"{CONSUMER_NAME}-{socket.gethostname()}-{os.getpid()}"
+
+
+def message_timestamp(message_id: str) -> datetime.datetime:
+    """Enqueue time encoded in the millisecond part of a stream entry ID."""
+    millis = int(message_id.split("-", 1)[0])
+    return datetime.datetime.fromtimestamp(millis / 1000, tz=datetime.timezone.utc)
+
+
+class ProviderProtocol(Protocol):
+    def search_iter(self, criteria: search_reqresp.SearchCriteria | None = None) -> AsyncIterator[compact.CompactOffer]:
+        ...
+
+
 class SearchRequestConsumer:
     """Redis stream consumer that fetches search tasks and stores provider results."""
 
     def __init__(
         self,
         redis_client: redis.Redis,
-        alpha_client: AlphaClient,
-        betta_client: BettaClient,
+        providers: Mapping[str, ProviderProtocol],
         *,
+        result_store: result_storage.ResultStore | None = None,
+        rates: Callable[[], Optional[CrossRates]] | None = None,
         stream: str = ACTION_SEARCH_TICKET_IN,
         group: str = CONSUMER_GROUP,
-        consumer_name: str = CONSUMER_NAME,
+        consumer_name: str | None = None,
         poll_timeout_ms: int = 1000,
         idle_sleep: float = 0.1,
+        concurrency: int = 8,
+        batch_size: int = 8,
+        claim_idle_ms: int = 300_000,
+        claim_interval: float = 30.0,
+        max_deliveries: int = 5,
+        flush_size: int = 50,
+        flush_interval: float = 0.5,
+        search_deadline: float = 120.0,
+        trace_sample_rate: float = 1.0,
+        profile_sample_rate: float = 0.0,
+        profile_dir: str = "profiles",
     ) -> None:
         self.redis_client = redis_client
-        self.alpha_client = alpha_client
-        self.betta_client = betta_client
+        self.providers = dict(providers)
+        self.result_store = result_store or result_storage.BinaryResultStore(redis_client)
+        self.rates = rates
         self.stream = stream
         self.group = group
-        self.consumer_name = consumer_name
+        self.consumer_name = consumer_name or default_consumer_name()
         self.poll_timeout_ms = poll_timeout_ms
         self.idle_sleep = idle_sleep
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, batch_size)
+        self.claim_idle_ms = claim_idle_ms
+        self.claim_interval = claim_interval
+        self.max_deliveries = max_deliveries
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.search_deadline = search_deadline
+        self.trace_sample_rate = trace_sample_rate
+        self.traces = tracing.TraceStore(redis_client, ttl=self.result_store.ttl)
+        self.profile_sample_rate = profile_sample_rate
+        self.profile_dir = profile_dir
         self._running = False
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._tasks: set[asyncio.Task] = set()
 
     async def start(self) -> None:
-        log.info("🚀 Starting search request consumer (%s)", self.consumer_name)
+        log.info(
+            "🚀 Starting search request consumer (%s, concurrency %s)",
+            self.consumer_name,
+            self.concurrency,
+        )
         await self._ensure_stream_group()
         self._running = True
+        claimer = asyncio.create_task(self._claim_loop())
 
         try:
             while self._running:
                 await self._consume_batch()
+        except asyncio.CancelledError:
+            for task in self._tasks:
+                task.cancel()
+            raise
         finally:
+            claimer.cancel()
+            if self._tasks:
+                log.info("Waiting for %s in-flight search requests", len(self._tasks))
+                await asyncio.gather(*self._tasks, return_exceptions=True)
             log.info("✅ Search request consumer stopped")
 
     def stop(self) -> None:
@@ -86,13 +153,51 @@ class SearchRequestConsumer:
             else:
                 raise
 
+    async def _acquire_slots(self, *, wait: bool) -> int:
+        """Reserve up to ``batch_size`` free handler slots, optionally waiting for the first."""
+        acquired = 0
+        if wait:
+            await self._slots.acquire()
+            acquired = 1
+        while acquired < self.batch_size and not self._slots.locked():
+            await self._slots.acquire()
+            acquired += 1
+        return acquired
+
+    def _release_slots(self, count: int) -> None:
+        for _ in range(count):
+            self._slots.release()
+
+    def _dispatch(self, message_id: str, message_data: dict) -> None:
+        """Run a message handler in the background; its slot is released when it finishes."""
+        task = asyncio.create_task(self._run_message(message_id, message_data))
+        self._tasks.add(task)
+
+        def _done(finished: asyncio.Task) -> None:
+            self._tasks.discard(finished)
+            self._slots.release()
+            if not finished.cancelled() and finished.exception() is not None:
+                exc = finished.exception()
+                log.error(
+                    "Unhandled error in search request %s: %s",
+                    message_id,
+                    exc,
+                    exc_info=(type(exc), exc, exc.__traceback__),
+                )
+
+        task.add_done_callback(_done)
+
     async def _consume_batch(self) -> None:
+        slots = await self._acquire_slots(wait=True)
         try:
+            if not self._running:
+                # Stopped while waiting for a free slot: drain without reading new entries.
+                return
             response: redis.ResponseT = await self.redis_client.xreadgroup(
                 groupname=self.group,
                 consumername=self.consumer_name,
                 streams={self.stream: ">"},
-                count=1,
+                count=slots,
                 block=self.poll_timeout_ms,
             )
 
@@ -102,54 +207,159 @@ class SearchRequestConsumer:
 
             for _, messages in response:
                 for message_id, message_data in messages:
-                    await self._handle_message(message_id, message_data)
+                    self._dispatch(message_id, message_data)
+                    slots -= 1
 
         except Exception as exc:  # pragma: no cover - defensive guardrail
             log.error("Error while consuming search requests: %s", exc, exc_info=True)
             await asyncio.sleep(1.0)
+        finally:
+            self._release_slots(slots)
+
+    async def _claim_loop(self) -> None:
+        while self._running:
+            await asyncio.sleep(self.claim_interval)
+            try:
+                await self._claim_stale_messages()
+            except Exception as exc:  # pragma: no cover - defensive guardrail
+                log.error("Error while reclaiming pending search requests: %s", exc, exc_info=True)
+
+    async def _claim_stale_messages(self) -> None:
+        """Take over entries left pending too long by consumers that died or failed them."""
+        start_id = "0-0"
+        while self._running:
+            slots = await self._acquire_slots(wait=True)
+            if not self._running:
+                self._release_slots(slots)
+                return
+            try:
+                response = await self.redis_client.xautoclaim(
+                    name=self.stream,
+                    groupname=self.group,
+                    consumername=self.consumer_name,
+                    min_idle_time=self.claim_idle_ms,
+                    start_id=start_id,
+                    count=slots,
+                )
+                start_id, messages = response[0], response[1]
+
+                for message_id, message_data in messages:
+                    if not message_data:
+                        # Entry was trimmed from the stream while pending.
+                        await self.redis_client.xack(self.stream, self.group, message_id)
+                        continue
+                    if await self._exceeded_deliveries(message_id, message_data):
+                        continue
+                    log.info("Reclaimed pending search request %s", message_id)
+                    self._dispatch(message_id, message_data)
+                    slots -= 1
+            finally:
+                self._release_slots(slots)
+
+            if start_id == "0-0" or not messages:
+                return
+
+    async def _exceeded_deliveries(self, message_id: str, message_data: dict) -> bool:
+        """Give up on messages that keep failing; mark their search as errored and ack them."""
+        pending = await self.redis_client.xpending_range(
+            self.stream, self.group, min=message_id, max=message_id, count=1
+        )
+        if not pending or pending[0]["times_delivered"] <= self.max_deliveries:
+            return False
+
+        log.error(
+            "Dropping search request %s after %s delivery attempts",
+            message_id,
+            pending[0]["times_delivered"],
+        )
+        request = await self._parse_request(message_id, message_data)
+        if request is None:
+            return True
+        await self._store_result(
+            compact.CompactSearch(
+                search_id=request.search_id,
+                status=search_reqresp.SearchStatus.ERROR,
+                message="Failed to process search request.",
+            ),
+            ack_message_id=message_id,
+        )
+        return True
+
+    async def _run_message(self, message_id: str, message_data: dict) -> None:
+        if random.random() < self.profile_sample_rate:
+            with tracing.profiled(self.profile_dir, f"search-{message_id}"):
+                await self._handle_message(message_id, message_data)
+        else:
+            await self._handle_message(message_id, message_data)
+
+    async def _parse_request(self, message_id: str, message_data: dict) -> Optional[search_reqresp.RedisSearchRequest]:
+        """The search request in a stream entry; malformed entries are acked and dropped, as they would fail on every delivery."""
+        try:
+            return search_reqresp.RedisSearchRequest.model_validate(message_data)
+        except ValidationError as exc:
+            log.error("Dropping malformed search request %s: %s", message_id, exc)
+            await self.redis_client.xack(self.stream, self.group, message_id)
+            return None
 
     async def _handle_message(self, message_id: str, message_data: dict) -> None:
-        request = search_reqresp.RedisSearchRequest.model_validate(message_data)
+        request = await self._parse_request(message_id, message_data)
+        if request is None:
+            return
         log.info("Processing search request with ID %s", request.search_id)
 
+        trace = tracing.NULL_TRACE
+        if random.random() < self.trace_sample_rate:
+            trace = tracing.SearchTrace(request.search_id, message_timestamp(message_id))
+            trace.add("queue", 0.0, trace.now(), message_id=message_id)
+
+        with tracing.activate(trace):
+            await self._process_search(message_id, request)
+        if trace is not tracing.NULL_TRACE:
+            try:
+                await self.traces.save(trace)
+            except Exception as exc:
+                log.warning("Could not store trace of search %s: %s", request.search_id, exc)
+
+    async def _process_search(self, message_id: str, request: search_reqresp.RedisSearchRequest) -> None:
+        tasks: list[asyncio.Task] = []
         try:
-            result = search_reqresp.SearchResponse(
+            result = compact.CompactSearch(
                 search_id=request.search_id,
-                status=search_reqresp.SearchStatus.PENDING,
-                items=[],
+                providers={name: search_reqresp.SearchStatus.PENDING for name in self.providers},
+                created_at=message_timestamp(message_id),
             )
-            await self.redis_client.json().set(
-                f"search_results:{request.search_id}",
-                 "$",
-                result.model_dump(mode="json"),
-            )
-            log.info("Requesting search from provider alpha for ID %s", request.search_id)
-            alpha_response = await self.alpha_client.search()
-            for item in alpha_response.root:
-                result.items.append(item)
-            log.info(
-                "Stored %s search results for ID %s",
-                len(alpha_response.root),
-                request.search_id,
+            merger = merge.OfferMerger(result, self.rates)
+            write_lock = asyncio.Lock()
+            # Providers still streaming at the deadline are cut off; the search completes with the others.
+            deadline = asyncio.get_running_loop().time() + self.search_deadline
+            await self._store_result(result)
+
+            tasks = [
+                asyncio.create_task(self._search_provider(name, client, request, merger, write_lock, deadline))
+                for name, client in self.providers.items()
+            ]
+            await asyncio.gather(*tasks)
+
+            if search_reqresp.SearchStatus.COMPLETED in result.providers.values():
+                result.status = search_reqresp.SearchStatus.COMPLETED
+            else:
+                result.status = search_reqresp.SearchStatus.ERROR
+                result.message = "All providers failed to return results."
+
+            # The final status and the ack commit together, so a crash cannot leave one without the other.
+            async with write_lock:
+                await self._store_result(result, ack_message_id=message_id)
+            metrics.SEARCH_COMPLETION_SECONDS.labels(result.status.value).observe(
+                time.time() - result.created_at.timestamp()
             )
-            log.info("Requesting search from provider betta for ID %s", request.search_id)
-            betta_response = await self.betta_client.search()
-            for item in betta_response.root:
-                result.items.append(item)
+            metrics.SEARCH_RESULT_BYTES.observe(result.encoded_bytes)
             log.info(
-                "Stored %s search results from Betta for ID %s",
-                len(betta_response.root),
+                "Stored %s search results for ID %s in %s bytes (status %s)",
+                len(result.items),
                 request.search_id,
+                result.encoded_bytes,
+                result.status.value,
             )
-
-            result.status = search_reqresp.SearchStatus.COMPLETED
-            await self.redis_client.json().set(
-                f"search_results:{request.search_id}",
-                "$",
-                result.model_dump(mode="json"),
-            )
-            log.info("Updated search results status to COMPLETED for ID %s", request.search_id)
-            await self.redis_client.xack(self.stream, self.group, message_id)
             log.info("Acknowledged message %s", message_id)
         except Exception as exc:
             log.error(
@@ -158,21 +368,94 @@ class SearchRequestConsumer:
                 exc,
                 exc_info=True,
             )
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _search_provider(
+        self,
+        name: str,
+        client: ProviderProtocol,
+        request: search_reqresp.RedisSearchRequest,
+        merger: merge.OfferMerger,
+        write_lock: asyncio.Lock,
+        deadline: float,
+    ) -> None:
+        """Stream one provider's offers into the merged result, writing it out in batches as they arrive.
+
+        Offers still outstanding at loop time ``deadline`` are abandoned. Failures are recorded in the provider's status instead of being raised.
+        """
+        log.info("Requesting search from provider %s for ID %s", name, request.search_id)
+        result = merger.result
+        pending = 0
+        offers = 0
+        flushed_at = time.monotonic()
+        trace = tracing.current()
+        started = trace.now()
+
+        async def _flush() -> None:
+            nonlocal pending, flushed_at
+            async with write_lock:
+                if result.status == search_reqresp.SearchStatus.PENDING:
+                    result.status = search_reqresp.SearchStatus.PARTIAL
+                await self._store_result(result)
+            pending, flushed_at = 0, time.monotonic()
+
+        try:
+            async for item in resilience.iter_until(client.search_iter(request.criteria), deadline):
+                merger.add(item, name)
+                pending += 1
+                offers += 1
+                if pending >= self.flush_size or time.monotonic() - flushed_at >= self.flush_interval:
+                    await _flush()
+            result.providers[name] = search_reqresp.SearchStatus.COMPLETED
+        except Exception as exc:
+            log.error("Provider %s failed for search %s: %s", name, request.search_id, exc)
+            result.providers[name] = search_reqresp.SearchStatus.ERROR
+        trace.add(f"provider.{name}", started, trace.now(), offers=offers, status=result.providers[name].value)
+
+        await _flush()
+        log.info("Provider %s finished search %s", name, request.search_id)
+
+    async def _store_result(self, result: compact.CompactSearch, ack_message_id: str | None = None) -> None:
+        ack = None
+        if ack_message_id is not None:
+            ack = result_storage.StreamAck(self.stream, self.group, ack_message_id)
+        with tracing.current().span(
+            "store.write_ack" if ack is not None else "store.write",
+            items=len(result.items),
+            status=result.status.value,
+        ):
+            await self.result_store.write(result, ack=ack)
 
 
 async def search_requests_consumer(
     redis_client: redis.Redis,
-    alpha_client: AlphaClient,
-    betta_client: BettaClient,
+    providers: Mapping[str, ProviderProtocol],
     *,
+    result_store: result_storage.ResultStore | None = None,
+    rates: Callable[[], Optional[CrossRates]] | None = None,
     poll_timeout_ms: int = 1000,
+    concurrency: int = 8,
+    batch_size: int = 8,
+    claim_idle_ms: int = 300_000,
+    flush_size: int = 50,
+    flush_interval: float = 0.5,
+    search_deadline: float = 120.0,
 ) -> None:
     """Entrypoint that satisfies ConsumerProtocol for background execution."""
     consumer = SearchRequestConsumer(
         redis_client=redis_client,
-        alpha_client=alpha_client,
-        betta_client=betta_client,
+        providers=providers,
+        result_store=result_store,
+        rates=rates,
         poll_timeout_ms=poll_timeout_ms,
+        concurrency=concurrency,
+        batch_size=batch_size,
+        claim_idle_ms=claim_idle_ms,
+        flush_size=flush_size,
+        flush_interval=flush_interval,
+        search_deadline=search_deadline,
     )
     await consumer.start()
 
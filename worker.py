@@ -0,0 +1,5 @@
+from src.worker import service
+
+if __name__ == "__main__":
+    # Run search consumers apart from the API; see src/worker/service.py
+    service.main()